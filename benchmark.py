@@ -0,0 +1,290 @@
+# benchmark.py
+# Load benchmark for Pulse Panel. Starts N synthetic game servers (this script in 'fake-server' mode,
+# configured as ordinary start commands), drives the real Socket.IO handlers through headless test
+# clients and writes the measurements as JSON, so runs can be compared over time:
+#
+#   python benchmark.py --servers 50 --rate 100 --duration 30 --output results.json
+#
+# Everything runs in a throwaway workspace (config, servers, logs, backups), never in the panel's own
+# directory. Latency is measured from the timestamp a fake server writes into each line to the moment a
+# client picks the line up; clients poll every CLIENT_POLL_INTERVAL, which bounds the resolution.
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_VERSION = 1
+CLIENT_POLL_INTERVAL = 0.005
+READY_LINE = 'Fake server ready'
+
+# --- Fake Game Server ---
+def run_fake_server(args):
+    # Writes 'bench <seq> <unix time>' lines at --rate per second, burns --cpu of a core, grows its RSS by
+    # --rss-growth MB/s and exits with code 1 after --crash-after seconds (0 = never). 'stop' on stdin
+    # exits cleanly, like a real server's stop command.
+    def read_commands():
+        for line in sys.stdin:
+            if line.strip() == 'stop':
+                sys.stdout.write('Stopping fake server\n'); sys.stdout.flush()
+                os._exit(0)
+    threading.Thread(target=read_commands, daemon=True).start()
+    print('Starting fake server', flush=True)
+    time.sleep(args.ready_after)
+    print(READY_LINE, flush=True)
+    started = time.monotonic()
+    crash_at = started + args.crash_after * random.uniform(0.5, 1.5) if args.crash_after else None
+    interval, seq, next_line, ballast, grown = 1.0 / args.rate if args.rate else None, 0, started, [], 0.0
+    while True:
+        now = time.monotonic()
+        if crash_at and now >= crash_at:
+            print('Fake server crashing', flush=True); os._exit(1)
+        if interval:
+            out = []
+            while next_line <= now:
+                seq += 1; out.append(f'bench {seq} {time.time():.6f}\n'); next_line += interval
+            if out: sys.stdout.write(''.join(out)); sys.stdout.flush()
+        if args.rss_growth and (now - started) * args.rss_growth > grown:
+            ballast.append(b'x' * (1024 * 1024)); grown += 1
+        if args.cpu:
+            burn_until = time.perf_counter() + 0.05 * args.cpu
+            while time.perf_counter() < burn_until: pass
+        time.sleep(max(0.0, min(0.05 * (1 - args.cpu), (next_line - time.monotonic()) if interval else 0.05)))
+
+# --- Measurements ---
+def percentiles(values):
+    if not values: return {'count': 0}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'count': len(values), 'min': values[0], 'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': values[-1], 'mean': sum(values) / len(values)}
+
+def rounded(stats, digits=3):
+    return {key: round(value, digits) if isinstance(value, float) else value for key, value in stats.items()}
+
+class Client:
+    # A headless Socket.IO client that tallies every event it receives.
+    def __init__(self, pp, name):
+        self.name = name
+        self.client = pp.socketio.test_client(pp.app)
+        self.events, self.bytes, self.latencies, self.lines = {}, {}, [], 0
+        self.last_seq, self.missing, self.notifications = {}, 0, []
+
+    def poll(self):
+        received = self.client.get_received()
+        now = time.time()
+        for packet in received:
+            name, size = packet['name'], len(json.dumps(packet['args']))
+            self.events[name] = self.events.get(name, 0) + 1
+            self.bytes[name] = self.bytes.get(name, 0) + size
+            if name == 'console_output': self._console(packet['args'][0], now)
+            elif name == 'notification': self.notifications.append(packet['args'][0])
+        return len(received)
+
+    def _console(self, frame, now):
+        for line in frame['data'].splitlines():
+            if not line.startswith('bench '): continue
+            _, seq, sent = line.split()
+            seq = int(seq)
+            previous = self.last_seq.get(frame['id'], 0)
+            if seq > previous + 1 and previous: self.missing += seq - previous - 1
+            self.last_seq[frame['id']] = max(previous, seq)
+            self.lines += 1; self.latencies.append(now - float(sent))
+
+    def reset(self):
+        self.events, self.bytes, self.latencies, self.lines, self.missing = {}, {}, [], 0, 0
+
+    def totals(self, seconds):
+        return {
+            'events': sum(self.events.values()), 'bytes': sum(self.bytes.values()),
+            'events_per_sec': round(sum(self.events.values()) / seconds, 2), 'bytes_per_sec': round(sum(self.bytes.values()) / seconds, 1),
+            'by_event': {name: {'events': count, 'bytes': self.bytes[name]} for name, count in sorted(self.events.items())}
+        }
+
+def poll_clients(clients, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if not sum(client.poll() for client in clients): time.sleep(CLIENT_POLL_INTERVAL)
+
+def wait_states(pp, server_ids, states, timeout, clients):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(pp.lifecycle.state(server_id) in states for server_id in server_ids): return True
+        poll_clients(clients, 0.05)
+    return False
+
+def make_tree(root, files, total_mb):
+    # Half the files are random (incompressible), half repeat a text pattern, spread over nested folders.
+    size = max(1, int(total_mb * 1024 * 1024 / files))
+    pattern = b'PlayerData{id=%d, level=42, inventory=[sword, shield, potion]}\n'
+    for n in range(files):
+        folder = os.path.join(root, f'world{n % 4}', f'region{n % 16}')
+        os.makedirs(folder, exist_ok=True)
+        data = os.urandom(size) if n % 2 else (pattern % n) * (size // len(pattern % n) + 1)
+        with open(os.path.join(folder, f'chunk{n}.dat'), 'wb') as f: f.write(data[:size])
+    return files * size
+
+# --- Phases ---
+def bench_console(pp, args, server_ids, clients):
+    # Every server starts through the real handler, then output is measured once all of them are ready.
+    started = time.monotonic()
+    for server_id in server_ids: clients[0].client.emit('start_server', {'id': server_id})
+    ready = wait_states(pp, server_ids, ('ready',), args.ready_after + 60, clients)
+    startup = time.monotonic() - started
+    for client in clients: client.reset()
+    sweeps, stop = [], threading.Event()
+    def sample_sweeps():
+        last = None
+        while not stop.wait(0.25):
+            if pp.resource_sampler.last_sweep_ms != last:
+                last = pp.resource_sampler.last_sweep_ms; sweeps.append(last)
+    threading.Thread(target=sample_sweeps, daemon=True).start()
+    measure_started = time.monotonic()
+    poll_clients(clients, args.duration)
+    seconds = time.monotonic() - measure_started
+    stop.set()
+    latencies = [latency * 1000 for latency in clients[0].latencies]
+    return {
+        'all_ready': ready, 'startup_seconds': round(startup, 3),
+        'seconds': round(seconds, 3), 'expected_lines_per_sec': args.servers * args.rate,
+        'lines_per_sec': round(clients[0].lines / seconds, 1), 'lines': clients[0].lines, 'missing_lines': clients[0].missing,
+        'latency_ms': rounded(percentiles(latencies)),
+        'crashes': sum(entry['crashes'] for entry in pp.lifecycle.servers.values()),
+    }, {'sweep_ms': rounded(percentiles(sweeps)), 'servers': args.servers, 'interval': pp.MONITOR_INTERVAL}, {
+        client.name: client.totals(seconds) for client in clients
+    }
+
+def bench_scheduler(pp, args, server_ids, clients):
+    # Restarts go through the real dispatch path (stagger heap, executor, per-action limits); jitter is
+    # the delay between the intended start (dispatch + stagger offset) and the task actually running.
+    original, intended, starts = pp.run_scheduled_task, {}, {}
+    def timed(server_id, action):
+        starts[server_id] = time.monotonic()
+        return original(server_id, action)
+    pp.run_scheduled_task = timed
+    history_before = len(pp.schedule_history_store.get())
+    try:
+        for server_id in server_ids:
+            intended[server_id] = time.monotonic() + pp.schedule_offset(server_id, 'restart')
+            pp.dispatch_scheduled_task(server_id, 'restart')
+        deadline = time.monotonic() + args.jitter + len(server_ids) * 30
+        while time.monotonic() < deadline and len(pp.schedule_history_store.get()) - history_before < len(server_ids):
+            poll_clients(clients, 0.1)
+    finally: pp.run_scheduled_task = original
+    runs = pp.schedule_history_store.get()[history_before:]
+    delays = [(starts[server_id] - intended[server_id]) * 1000 for server_id in starts]
+    return {
+        'tasks': len(server_ids), 'completed': len(runs), 'jitter_window': args.jitter, 'restart_limit': pp.schedule_limit('restart'),
+        'start_delay_ms': rounded(percentiles(delays)), 'run_seconds': rounded(percentiles([run['duration'] for run in runs])),
+        'results': {result: sum(1 for run in runs if run['result'] == result) for result in {run['result'] for run in runs}}
+    }
+
+def bench_backup(pp, args, workspace, clients):
+    # Cold backup, unchanged incremental backup, restore into an emptied directory, then an in-place
+    # restore where every file is already up to date.
+    server_dir = os.path.join(workspace, 'servers', 'backup-bench')
+    total = make_tree(server_dir, args.backup_files, args.backup_mb)
+    pp.servers_store.update(lambda servers: servers.append({'id': 'backup-bench', 'name': 'backup-bench', 'cwd': server_dir, 'start_command': ''}))
+    results, mb = {'files': args.backup_files, 'bytes': total, 'codec': pp.backup_codec_settings()[0]}, total / (1024 * 1024)
+    def timed(name, task, *task_args):
+        started = time.perf_counter()
+        value = task(*task_args)
+        seconds = time.perf_counter() - started
+        results[name] = {'seconds': round(seconds, 3), 'mb_per_sec': round(mb / seconds, 1) if seconds else None}
+        poll_clients(clients, 0)
+        return value
+    filename = timed('backup_full', pp._create_backup_task, 'backup-bench')
+    timed('backup_unchanged', pp._create_backup_task, 'backup-bench')
+    for entry in os.scandir(server_dir):
+        if entry.name != pp.BACKUP_DIR_NAME: shutil.rmtree(entry.path)
+    timed('restore_empty', pp._restore_backup_task, 'backup-bench', filename)
+    timed('restore_unchanged', pp._restore_backup_task, 'backup-bench', filename)
+    results['stored_bytes'] = sum(os.path.getsize(os.path.join(d, name)) for d, _, names in os.walk(os.path.join(server_dir, pp.BACKUP_DIR_NAME)) for name in names)
+    results['errors'] = [n['message'] for n in clients[0].notifications if n.get('status') == 'error']
+    return results
+
+# --- Runner ---
+def fake_server_command(args):
+    options = f'--rate {args.rate} --cpu {args.cpu} --rss-growth {args.rss_growth} --crash-after {args.crash_after} --ready-after {args.ready_after}'
+    return f'"{sys.executable}" "{os.path.abspath(__file__)}" fake-server {options}'
+
+def run_benchmark(args):
+    workspace = os.path.abspath(args.workspace or tempfile.mkdtemp(prefix='pulse-bench-'))
+    os.makedirs(workspace, exist_ok=True)
+    output = os.path.abspath(args.output) if args.output else None
+    os.chdir(workspace)
+    sys.path.insert(0, REPO_DIR)
+    import pulse_panel as pp
+    pp.first_time_setup()
+    pp.config_store.update(lambda config: config.update({'schedule_jitter': args.jitter}))
+    server_ids = [f'bench{n}' for n in range(args.servers)]
+    lifecycle = {'stop_commands': ['stop'], 'stop_timeout': 10, 'auto_restart': bool(args.crash_after), 'probe': {'type': 'log', 'pattern': READY_LINE}}
+    servers = [{'id': server_id, 'name': server_id, 'cwd': os.path.join(workspace, 'servers', server_id), 'start_command': fake_server_command(args), 'lifecycle': lifecycle}
+               for server_id in server_ids]
+    for server in servers: os.makedirs(server['cwd'], exist_ok=True)
+    pp.servers_store.update(lambda stored: stored.extend(servers))
+    pp.console_logs.start()
+    for target in (pp.pipe_mux.run, pp.lifecycle.run, pp.console_pipeline.run, pp.monitor_servers, pp.scheduler_thread):
+        threading.Thread(target=target, daemon=True).start()
+
+    clients = [Client(pp, f'client{n}') for n in range(args.clients)]
+    # client0 watches every console; the others watch the fleet overview and one console each.
+    for server_id in server_ids: clients[0].client.emit('subscribe', {'channel': 'console', 'id': server_id})
+    for n, client in enumerate(clients):
+        client.client.emit('subscribe', {'channel': 'fleet'})
+        if n: client.client.emit('subscribe', {'channel': 'console', 'id': server_ids[(n - 1) % len(server_ids)]})
+
+    results = {'version': RESULTS_VERSION, 'started_at': datetime.now().isoformat(timespec='seconds'), 'params': vars(args),
+               'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()}}
+    print(f"Benchmarking {args.servers} servers x {args.rate} lines/s for {args.duration}s in {workspace}")
+    results['console'], results['monitor'], results['emits'] = bench_console(pp, args, server_ids, clients)
+    if not args.skip_scheduler: results['scheduler'] = bench_scheduler(pp, args, server_ids, clients)
+    for server_id in server_ids: clients[0].client.emit('stop_server', {'id': server_id})
+    results['shutdown_clean'] = wait_states(pp, server_ids, ('offline', 'crashed'), 30, clients)
+    if not args.skip_backup: results['backup'] = bench_backup(pp, args, workspace, clients)
+    results['threads'] = threading.active_count()
+
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f: f.write(text)
+        print(f"Results written to {output}")
+    else: print(text)
+    if not args.workspace and not args.keep: shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Pulse Panel load benchmark.')
+    sub = parser.add_subparsers(dest='mode')
+    fake = sub.add_parser('fake-server', help='Run as a synthetic game server (used as the start command).')
+    for target in (parser, fake):
+        target.add_argument('--rate', type=float, default=50, help='Console lines per second per server.')
+        target.add_argument('--cpu', type=float, default=0.0, help='Fraction of one core each server burns (0-1).')
+        target.add_argument('--rss-growth', type=float, default=0.0, help='MB of memory each server allocates per second.')
+        target.add_argument('--crash-after', type=float, default=0.0, help='Crash after about this many seconds (0 = never); enables auto-restart.')
+        target.add_argument('--ready-after', type=float, default=1.0, help='Seconds before a server prints its ready line.')
+    parser.add_argument('--servers', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of steady-state console measurement.')
+    parser.add_argument('--clients', type=int, default=3, help='Headless Socket.IO clients.')
+    parser.add_argument('--jitter', type=int, default=0, help='schedule_jitter (seconds) for the scheduler phase.')
+    parser.add_argument('--backup-files', type=int, default=400)
+    parser.add_argument('--backup-mb', type=float, default=64)
+    parser.add_argument('--skip-scheduler', action='store_true')
+    parser.add_argument('--skip-backup', action='store_true')
+    parser.add_argument('--workspace', help='Directory to run in (default: a temporary directory that is removed afterwards).')
+    parser.add_argument('--keep', action='store_true', help='Keep the temporary workspace.')
+    parser.add_argument('--output', help='Write the JSON results here instead of stdout.')
+    args = parser.parse_args()
+    if args.mode == 'fake-server': run_fake_server(args)
+    else:
+        del args.mode
+        run_benchmark(args)
+        os._exit(0)  # Daemon threads (pipe loop, monitor, scheduler) don't need a clean shutdown.
+
+if __name__ == '__main__':
+    main()
@@ -12,47 +12,179 @@ import requests
 import zipfile
 import io
 import shutil
+import hashlib
+import zlib
+import lzma
+import mmap
+import re
+import struct
+import copy
+import functools
+import tempfile
+import bisect
+import array
+import codecs
+import socket
+import heapq
+import itertools
 import schedule
+import selectors
 from datetime import datetime
-from collections import deque
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
-from flask import Flask, render_template_string, send_from_directory
-from flask_socketio import SocketIO
+from flask import Flask, Response, render_template_string, send_from_directory, request
+from flask_socketio import SocketIO, join_room, leave_room
+
+try:
+    import zstandard  # Optional: enables the 'zstd' backup codec.
+except ImportError:
+    zstandard = None
+try:
+    import fcntl  # Not available on Windows; hot snapshots fall back to hardlinks/copies.
+except ImportError:
+    fcntl = None
+try:
+    import ctypes, ctypes.util  # inotify (Linux only) invalidates cached directory listings.
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+except (ImportError, OSError, AttributeError):
+    libc = None
+try:
+    import msvcrt, ctypes  # Windows pipes can't be selected; the pipe multiplexer polls them with PeekNamedPipe.
+    kernel32 = ctypes.windll.kernel32
+except (ImportError, AttributeError):
+    msvcrt = kernel32 = None
 
 # --- Configuration Files ---
 CONFIG_FILE = 'config.json'
 SERVERS_FILE = 'servers.json'
 GAMES_FILE = 'games.json'
 SCHEDULES_FILE = 'schedules.json'
+SCHEDULE_HISTORY_FILE = 'schedule_history.json'
+STEAM_JOBS_FILE = 'steam_jobs.json'
+
+# --- Instrumentation ---
+# Counters and histograms are kept in process and rendered in the Prometheus text format by /metrics,
+# together with gauges that collectors read at scrape time (queue depths, threads, per-server samples).
+# InstrumentedSocketIO times every @socketio.on handler and counts every emit by event with an estimate
+# of its payload size: the length of its string fields, which is where console, file and log bytes are.
+# Serializing every payload a second time just to measure it would double the cost of the hottest emits.
+METRIC_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+def payload_size(value, depth=3):
+    if isinstance(value, str): return len(value)
+    if depth and isinstance(value, dict): return sum(payload_size(v, depth - 1) for v in value.values())
+    if depth and isinstance(value, (list, tuple)): return sum(payload_size(v, depth - 1) for v in value)
+    return 0
+
+def metric_line(name, labels, value):
+    if not labels: return f'{name} {value}'
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return f'{name}{{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + f'}} {value}'
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values, self.histograms, self.kinds, self.collectors = {}, {}, {}, []
+
+    def describe(self, name, kind, text):
+        self.kinds[name] = (kind, text)
+
+    def inc(self, name, labels=(), amount=1):
+        with self.lock: self.values[(name, labels)] = self.values.get((name, labels), 0) + amount
+
+    def observe(self, name, labels, seconds):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None: histogram = self.histograms[(name, labels)] = [[0] * (len(METRIC_BUCKETS) + 1), 0.0]
+            histogram[0][bisect.bisect_left(METRIC_BUCKETS, seconds)] += 1; histogram[1] += seconds
+
+    def render(self):
+        with self.lock:
+            values = list(self.values.items())
+            histograms = [(key, list(counts), total) for key, (counts, total) in self.histograms.items()]
+        lines = {}
+        for (name, labels), value in values: lines.setdefault(name, []).append(metric_line(name, labels, value))
+        for (name, labels), counts, total in histograms:
+            out, cumulative = lines.setdefault(name, []), 0
+            for bound, count in zip(METRIC_BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                out.append(metric_line(f'{name}_bucket', labels + (('le', bound),), cumulative))
+            out += [metric_line(f'{name}_sum', labels, round(total, 6)), metric_line(f'{name}_count', labels, cumulative)]
+        for collect in self.collectors:
+            try:
+                for name, labels, value in collect(): lines.setdefault(name, []).append(metric_line(name, labels, value))
+            except Exception as e: print(f"METRICS: collector failed: {e}")
+        text = []
+        for name in sorted(lines):
+            kind, help_text = self.kinds.get(name, ('untyped', name))
+            text += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'] + lines[name]
+        return '\n'.join(text) + '\n'
+
+panel_metrics = MetricsRegistry()
+for _name, _kind, _text in (
+    ('pulse_handler_seconds', 'histogram', 'Time spent in Socket.IO handlers.'),
+    ('pulse_handler_errors_total', 'counter', 'Socket.IO handlers that raised.'),
+    ('pulse_handlers_in_flight', 'gauge', 'Socket.IO handlers currently running.'),
+    ('pulse_emits_total', 'counter', 'Socket.IO emits by event.'),
+    ('pulse_emit_bytes_total', 'counter', 'Estimated payload bytes (string fields) emitted by event.'),
+    ('pulse_monitor_tick_seconds', 'histogram', 'Duration of one monitor_servers tick.'),
+    ('pulse_sampler_sweep_seconds', 'histogram', 'Duration of one resource sampler sweep.'),
+    ('pulse_console_flush_seconds', 'histogram', 'Duration of one console pipeline flush.'),
+    ('pulse_backup_seconds', 'histogram', 'Duration of successful backups.'),
+    ('pulse_restore_seconds', 'histogram', 'Duration of successful restores.'),
+    ('pulse_scheduled_runs_total', 'counter', 'Scheduled task runs by action and result.'),
+    ('pulse_scheduled_run_seconds', 'histogram', 'Duration of scheduled task runs.'),
+):
+    panel_metrics.describe(_name, _kind, _text)
+
+class InstrumentedSocketIO(SocketIO):
+    def on(self, message, namespace=None):
+        register, labels = super().on(message, namespace), (('event', message),)
+        def decorator(handler):
+            @functools.wraps(handler)
+            def timed(*args, **kwargs):
+                panel_metrics.inc('pulse_handlers_in_flight', labels)
+                started = time.perf_counter()
+                try: return handler(*args, **kwargs)
+                except Exception:
+                    panel_metrics.inc('pulse_handler_errors_total', labels); raise
+                finally:
+                    panel_metrics.observe('pulse_handler_seconds', labels, time.perf_counter() - started)
+                    panel_metrics.inc('pulse_handlers_in_flight', labels, -1)
+            return register(timed)
+        return decorator
+
+    def emit(self, event, *args, **kwargs):
+        labels = (('event', event),)
+        panel_metrics.inc('pulse_emits_total', labels)
+        panel_metrics.inc('pulse_emit_bytes_total', labels, payload_size(args))
+        return super().emit(event, *args, **kwargs)
 
 # --- Flask App Setup ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'definitive-edition-secret-key'
-socketio = SocketIO(app, async_mode='threading')
+socketio = InstrumentedSocketIO(app, async_mode='threading')
 
 # --- Globals for Server Management ---
 server_processes = {}
-steam_process = None
-backup_process_lock = threading.Lock()
-performance_data = {}
 MAX_PERF_DATA_POINTS = 30
+MONITOR_INTERVAL = 3
+METRICS_DIR = 'metrics'
 
 # --- Configuration & File Helpers ---
 def load_config():
-    if not os.path.exists(CONFIG_FILE):
-        default_config = {"steamcmd_path": ""}
-        with open(CONFIG_FILE, 'w') as f: json.dump(default_config, f, indent=2)
-        return default_config
-    try:
-        with open(CONFIG_FILE, 'r') as f: return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError): return {"steamcmd_path": ""}
+    return config_store.get()
 
 def first_time_setup():
-    load_config()
+    if not os.path.exists(CONFIG_FILE):
+        save_json_file(CONFIG_FILE, {"steamcmd_path": ""})
     if not os.path.exists(SERVERS_FILE):
-        with open(SERVERS_FILE, 'w') as f: json.dump([], f)
+        save_json_file(SERVERS_FILE, [])
     if not os.path.exists(SCHEDULES_FILE):
-        with open(SCHEDULES_FILE, 'w') as f: json.dump({}, f)
+        save_json_file(SCHEDULES_FILE, {})
     if not os.path.exists(GAMES_FILE):
         # This now creates the separate file as requested
         default_games = [
@@ -63,7 +195,7 @@ def first_time_setup():
             {"id": "sevendays", "name": "7 Days to Die", "appid": "294420"},
             {"id": "rust", "name": "Rust", "appid": "258550"}
         ]
-        with open(GAMES_FILE, 'w') as f: json.dump(default_games, f, indent=2)
+        save_json_file(GAMES_FILE, default_games)
 
 def load_json_file(file_path, is_dict=False):
     default = {} if is_dict else []
@@ -73,14 +205,78 @@ def load_json_file(file_path, is_dict=False):
             return json.loads(content) if content else default
     except (json.JSONDecodeError, FileNotFoundError): return default
 
-def save_json_file(file_path, data):
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+def save_json_file(file_path, data, indent=2):
+    # Write to a temp file in the same directory and swap it in, so readers never see a half-written file.
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent); f.flush(); os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+# --- Configuration Registry ---
+# Every JSON file is parsed once and kept in memory. A reload only happens when the file's
+# mtime/size changes on disk (e.g. hand edits), and all writes go through one lock per file.
+# Data returned by get()/by_id() is shared and must be treated as read-only; use update().
+class JsonStore:
+    def __init__(self, path, default, index_key=None):
+        self.path, self.default, self.index_key = path, default, index_key
+        self.lock = threading.RLock()
+        self._data, self._index, self._stamp = copy.deepcopy(default), {}, None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError: return None
+
+    def _set(self, data, stamp):
+        index = {}
+        if self.index_key and isinstance(data, list):
+            index = {item[self.index_key]: item for item in data if isinstance(item, dict) and self.index_key in item}
+        self._data, self._index, self._stamp = data, index, stamp
+
+    def get(self):
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            with self.lock:
+                if stamp != self._stamp:
+                    data = load_json_file(self.path, is_dict=isinstance(self.default, dict))
+                    if stamp is None or not isinstance(data, type(self.default)): data = copy.deepcopy(self.default)
+                    self._set(data, stamp)
+        return self._data
+
+    def by_id(self, key):
+        self.get()
+        return self._index.get(key)
+
+    def update(self, mutate):
+        # mutate() edits a private copy in place; its return value is passed back to the caller.
+        with self.lock:
+            data = copy.deepcopy(self.get())
+            result = mutate(data)
+            save_json_file(self.path, data)
+            self._set(data, self._file_stamp())
+            return result
+
+    def remove_by_id(self, key):
+        def apply(items):
+            items[:] = [item for item in items if item.get(self.index_key) != key]
+        self.update(apply)
+
+config_store = JsonStore(CONFIG_FILE, {"steamcmd_path": ""})
+servers_store = JsonStore(SERVERS_FILE, [], index_key='id')
+games_store = JsonStore(GAMES_FILE, [], index_key='id')
+schedules_store = JsonStore(SCHEDULES_FILE, {})
+schedule_history_store = JsonStore(SCHEDULE_HISTORY_FILE, [])
+steam_jobs_store = JsonStore(STEAM_JOBS_FILE, [], index_key='id')
 
 def get_server_config(server_id):
-    for server in load_json_file(SERVERS_FILE):
-        if server['id'] == server_id: return server
-    return None
+    return servers_store.by_id(server_id)
 
 def get_safe_path(server_id, relative_path=""):
     server_config = get_server_config(server_id)
@@ -92,126 +288,2602 @@ def get_safe_path(server_id, relative_path=""):
         return None, "Access denied."
     return full_path, None
 
+# --- Subscriptions ---
+# Clients join Socket.IO rooms for what they are looking at: 'fleet' for the overview summary, and
+# 'console:<id>' / 'performance:<id>' for a single server's console and detailed metrics.
+SERVER_CHANNELS = ('console', 'performance')
+
+def subscription_room(channel, server_id=None, path=None):
+    if channel == 'fleet': return 'fleet'
+    if channel in SERVER_CHANNELS and server_id: return f"{channel}:{server_id}"
+    if channel == 'tail' and server_id and path: return f"tail:{server_id}:{path}"
+    return None
+
+# --- Console Scrollback ---
+# Every console line gets a per-server sequence number and is kept in a bounded ring buffer so late
+# or reconnecting clients can replay what they missed. Each server keeps at most
+# CONSOLE_HISTORY_SERVER_BYTES, and once all buffers together pass CONSOLE_HISTORY_TOTAL_BYTES the
+# largest ones are trimmed, so memory stays fixed however many servers are running.
+CONSOLE_HISTORY_TOTAL_BYTES = 32 * 1024 * 1024
+CONSOLE_HISTORY_SERVER_BYTES = 2 * 1024 * 1024
+CONSOLE_HISTORY_CHUNK_OVERHEAD = 80
+CONSOLE_REPLAY_DEFAULT_BYTES = 64 * 1024
+CONSOLE_LINE = re.compile(r'[^\n]*\n|[^\n]+')
+
+def console_lines(text):
+    return CONSOLE_LINE.findall(text)
+
+class ConsoleScrollback:
+    def __init__(self, total_bytes=CONSOLE_HISTORY_TOTAL_BYTES, server_bytes=CONSOLE_HISTORY_SERVER_BYTES):
+        self.total_limit, self.server_limit = total_bytes, server_bytes
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.total = 0
+
+    def append(self, server_id, lines):
+        # Returns the sequence number of the first of the lines.
+        cost = sum(map(len, lines)) + CONSOLE_HISTORY_CHUNK_OVERHEAD * len(lines)
+        with self.lock:
+            buf = self.buffers.get(server_id)
+            if buf is None: buf = self.buffers[server_id] = {'chunks': deque(), 'first': 1, 'next': 1, 'size': 0}
+            seq = buf['next']
+            buf['chunks'].extend(lines); buf['next'] += len(lines); buf['size'] += cost; self.total += cost
+            while buf['size'] > self.server_limit and len(buf['chunks']) > 1: self._evict(buf)
+            if self.total > self.total_limit: self._trim_largest()
+            return seq
+
+    def _evict(self, buf):
+        cost = len(buf['chunks'].popleft()) + CONSOLE_HISTORY_CHUNK_OVERHEAD
+        buf['first'] += 1; buf['size'] -= cost; self.total -= cost
+
+    def _trim_largest(self):
+        # Trim down to 90% so a full fleet doesn't rescan every buffer on every line.
+        target = self.total_limit * 0.9
+        for buf in sorted(self.buffers.values(), key=lambda b: b['size'], reverse=True):
+            while self.total > target and buf['chunks'] and buf['size'] > self.total_limit / (2 * len(self.buffers)): self._evict(buf)
+            if self.total <= target: break
+
+    def cursor(self, server_id):
+        with self.lock:
+            buf = self.buffers.get(server_id)
+            return buf['next'] - 1 if buf else 0
+
+    def read(self, server_id, since=None, max_bytes=CONSOLE_REPLAY_DEFAULT_BYTES, max_lines=None):
+        with self.lock:
+            buf = self.buffers.get(server_id)
+            if not buf: return {'start': 1, 'cursor': 0, 'lines': [], 'truncated': False}
+            cursor, lines, size, seq, cut = buf['next'] - 1, [], 0, buf['next'] - 1, False
+            since = since or 0
+            for chunk in reversed(buf['chunks']):
+                if seq <= since or (max_lines and len(lines) >= max_lines): break
+                if size + len(chunk) > max_bytes:
+                    # A single line longer than the budget is sent cut to its tail rather than hiding everything.
+                    if not lines and max_bytes > 0: lines.append(chunk[-max_bytes:]); seq -= 1; cut = True
+                    break
+                lines.append(chunk); size += len(chunk); seq -= 1
+            lines.reverse()
+            return {'start': seq + 1, 'cursor': cursor, 'lines': lines, 'truncated': cut or seq > since}
+
+    def discard(self, server_id):
+        with self.lock:
+            buf = self.buffers.pop(server_id, None)
+            if buf: self.total -= buf['size']
+
+console_scrollback = ConsoleScrollback()
+
+# --- Console Pipeline ---
+# Server output is split into lines, buffered per server and sent as one 'console_output' frame per flush instead of
+# one emit per line. A flush happens every CONSOLE_FLUSH_INTERVAL or as soon as a server has
+# CONSOLE_FLUSH_BYTES pending; frames always end on a line boundary and carry the scrollback
+# sequence range ('start'..'cursor') they cover. If emitting starts eating into the interval the
+# flusher backs off (up to CONSOLE_MAX_INTERVAL), and a server that outruns the
+# CONSOLE_MAX_PENDING_BYTES cap has its oldest lines dropped and replaced by a marker.
+CONSOLE_FLUSH_BYTES = 16 * 1024
+CONSOLE_FLUSH_INTERVAL = 0.05
+CONSOLE_MAX_INTERVAL = 1.0
+CONSOLE_MAX_PENDING_BYTES = 1024 * 1024
+
+class ConsolePipeline:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {}
+        self.interval = CONSOLE_FLUSH_INTERVAL
+
+    def write(self, server_id, text):
+        lines = console_lines(text)
+        if not lines: return
+        with self.lock:
+            seq = console_scrollback.append(server_id, lines)
+            buf = self.pending.get(server_id)
+            if buf is None: buf = self.pending[server_id] = {'chunks': deque(), 'start': seq, 'size': 0, 'dropped': 0}
+            buf['chunks'].extend(lines); buf['size'] += len(text)
+            while buf['size'] > CONSOLE_MAX_PENDING_BYTES and len(buf['chunks']) > 1:
+                buf['size'] -= len(buf['chunks'].popleft()); buf['dropped'] += 1; buf['start'] += 1
+            full = buf['size'] >= CONSOLE_FLUSH_BYTES
+        if full and self.interval == CONSOLE_FLUSH_INTERVAL: self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending: return
+            pending, self.pending = self.pending, {}
+        started = time.perf_counter()
+        for server_id, buf in pending.items(): self._emit_buffer(server_id, buf)
+        elapsed = time.perf_counter() - started
+        panel_metrics.observe('pulse_console_flush_seconds', (), elapsed)
+        if elapsed > self.interval / 2: self.interval = min(self.interval * 2, CONSOLE_MAX_INTERVAL)
+        elif self.interval > CONSOLE_FLUSH_INTERVAL: self.interval = max(self.interval / 2, CONSOLE_FLUSH_INTERVAL)
+
+    def replay(self, server_id, since=None, max_bytes=CONSOLE_REPLAY_DEFAULT_BYTES, max_lines=None):
+        # Pending output is sent before the history is read, so no later frame overlaps the replay cursor.
+        with self.lock:
+            buf = self.pending.pop(server_id, None)
+            history = console_scrollback.read(server_id, since, max_bytes, max_lines)
+        if buf: self._emit_buffer(server_id, buf)
+        return history
+
+    def _emit_buffer(self, server_id, buf):
+        prefix = f"\n--- {buf['dropped']} console lines dropped (output too fast) ---\n" if buf['dropped'] else ''
+        frame, size, start = [], 0, buf['start']
+        for chunk in buf['chunks']:
+            frame.append(chunk); size += len(chunk)
+            if size >= CONSOLE_FLUSH_BYTES:
+                self._emit(server_id, frame, start, prefix); start += len(frame); frame, size, prefix = [], 0, ''
+        if frame: self._emit(server_id, frame, start, prefix)
+
+    def _emit(self, server_id, frame, start, prefix=''):
+        socketio.emit('console_output', {'id': server_id, 'data': prefix + ''.join(frame), 'lines': len(frame), 'start': start, 'cursor': start + len(frame) - 1}, to=subscription_room('console', server_id))
+
+console_pipeline = ConsolePipeline()
+
+# --- Console Logs ---
+# Everything sent to a server console (and all SteamCMD output, under the 'steamcmd' stream) is also
+# written to logs/<stream>/ with a timestamp on every line. emit_console only queues the text; a writer
+# thread appends it to the open segment once per LOG_FLUSH_INTERVAL and notes (time, offset) in the
+# segment's index every LOG_INDEX_INTERVAL seconds or LOG_INDEX_BYTES. Segments are closed by size or
+# age and compressed in the background as one zlib stream per index block, so a time-range query
+# seeks to the right block and decompresses only the blocks it needs.
+LOG_DIR = 'logs'
+LOG_FLUSH_INTERVAL = 1.0
+LOG_SEGMENT_BYTES = 16 * 1024 * 1024
+LOG_SEGMENT_AGE = 6 * 3600
+LOG_INDEX_BYTES = 256 * 1024
+LOG_INDEX_INTERVAL = 10
+LOG_RETENTION_BYTES = 256 * 1024 * 1024
+LOG_READ_MAX_BYTES = 4 * 1024 * 1024
+LOG_RAW_INDEX = struct.Struct('<dQ')    # time, offset in the .log file
+LOG_ZIP_INDEX = struct.Struct('<dQQ')   # time, uncompressed offset, offset in the .log.z file
+
+def log_stamp(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+
+class ConsoleLogWriter:
+    def __init__(self, root=LOG_DIR):
+        self.root, self.lock, self.write_lock = root, threading.Lock(), threading.Lock()  # lock: pending; write_lock: segments
+        self.pending, self.active, self.line_start = {}, {}, {}
+        self.compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compress')
+
+    def stream_dir(self, stream):
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9_.-]', '_', stream))
+
+    def append(self, stream, text):
+        with self.lock: self.pending.setdefault(stream, []).append((time.time(), text))
+
+    def start(self):
+        # Segments left open by a previous run are closed and compressed.
+        if os.path.isdir(self.root):
+            for entry in os.scandir(self.root):
+                for name, kind in self.segments_in(entry.path):
+                    if kind == 'raw': self.compressor.submit(self._compress, entry.path, name)
+        threading.Thread(target=self.run, name='console-log', daemon=True).start()
+
+    def run(self):
+        while True:
+            time.sleep(LOG_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock: pending, self.pending = self.pending, {}
+            for stream, chunks in pending.items():
+                try: self._write(stream, chunks)
+                except OSError as e: print(f"LOGS: Could not write console log for '{stream}': {e}")
+
+    def _open(self, stream, ts):
+        directory = self.stream_dir(stream)
+        os.makedirs(directory, exist_ok=True)
+        name = str(int(ts * 1000))
+        segment = {'dir': directory, 'name': name, 'opened': ts, 'size': 0, 'indexed_ts': ts, 'indexed_size': 0,
+                   'file': open(os.path.join(directory, f"{name}.log"), 'ab'), 'index': open(os.path.join(directory, f"{name}.idx"), 'ab')}
+        segment['index'].write(LOG_RAW_INDEX.pack(ts, 0))
+        self.active[stream] = segment
+        return segment
+
+    def _close(self, stream):
+        segment = self.active.pop(stream, None)
+        if not segment: return
+        segment['file'].close(); segment['index'].close()
+        self.compressor.submit(self._compress, segment['dir'], segment['name'])
+
+    def _write(self, stream, chunks):
+        segment = self.active.get(stream)
+        if segment and (segment['size'] >= LOG_SEGMENT_BYTES or chunks[0][0] - segment['opened'] >= LOG_SEGMENT_AGE): self._close(stream)
+        segment = self.active.get(stream) or self._open(stream, chunks[0][0])
+        at_start = self.line_start.get(stream, True)
+        for ts, text in chunks:
+            # Index points only fall on line starts, so every block decompresses to whole lines.
+            if at_start and (segment['size'] - segment['indexed_size'] >= LOG_INDEX_BYTES or ts - segment['indexed_ts'] >= LOG_INDEX_INTERVAL):
+                segment['index'].write(LOG_RAW_INDEX.pack(ts, segment['size']))
+                segment['indexed_ts'], segment['indexed_size'] = ts, segment['size']
+            stamp = f"[{log_stamp(ts)}] "
+            lines = text.splitlines(keepends=True)
+            data = ''.join(stamp + line if n or at_start else line for n, line in enumerate(lines)).encode('utf-8', errors='replace')
+            segment['file'].write(data); segment['size'] += len(data)
+            if lines: at_start = lines[-1].endswith(('\n', '\r'))
+        self.line_start[stream] = at_start
+        segment['file'].flush(); segment['index'].flush()
+
+    def _compress(self, directory, name):
+        base = os.path.join(directory, name)
+        try:
+            with open(f"{base}.idx", 'rb') as f: raw = f.read()
+            entries = [LOG_RAW_INDEX.unpack_from(raw, n) for n in range(0, len(raw) - LOG_RAW_INDEX.size + 1, LOG_RAW_INDEX.size)]
+        except OSError: entries = []
+        if not entries: entries = [(int(name) / 1000, 0)]
+        size = os.path.getsize(f"{base}.log")
+        entries = [e for e in entries if e[1] <= size]
+        with open(f"{base}.log", 'rb') as src, open(f"{base}.log.z.tmp", 'wb') as dst:
+            index = bytearray()
+            for n, (ts, offset) in enumerate(entries):
+                end = entries[n + 1][1] if n + 1 < len(entries) else size
+                index += LOG_ZIP_INDEX.pack(ts, offset, dst.tell())
+                src.seek(offset); dst.write(zlib.compress(src.read(end - offset), 6))
+        with open(f"{base}.zidx", 'wb') as f: f.write(index)
+        os.replace(f"{base}.log.z.tmp", f"{base}.log.z")
+        for ext in ('.log', '.idx'):
+            try: os.remove(base + ext)
+            except OSError: pass
+        self._enforce_retention(directory)
+
+    def _enforce_retention(self, directory):
+        closed = [name for name, kind in self.segments_in(directory) if kind == 'zip']
+        total = sum(os.path.getsize(os.path.join(directory, f"{name}.log.z")) for name in closed)
+        for name in closed:
+            if total <= LOG_RETENTION_BYTES: break
+            total -= os.path.getsize(os.path.join(directory, f"{name}.log.z"))
+            for ext in ('.log.z', '.zidx'): os.remove(os.path.join(directory, name + ext))
+
+    def segments_in(self, directory):
+        # [(name, 'raw' | 'zip')] oldest first; a segment's name is its start time in ms.
+        found = {}
+        if not os.path.isdir(directory): return []
+        for entry in os.scandir(directory):
+            stem, _, ext = entry.name.partition('.')
+            if stem.isdigit() and ext == 'log' and stem not in found: found[stem] = 'raw'
+            elif stem.isdigit() and ext == 'zidx': found[stem] = 'zip'
+        return sorted(found.items(), key=lambda item: int(item[0]))
+
+    def _blocks(self, directory, name, kind, start_ts, end_ts):
+        base = os.path.join(directory, name)
+        record = LOG_RAW_INDEX if kind == 'raw' else LOG_ZIP_INDEX
+        with open(f"{base}.idx" if kind == 'raw' else f"{base}.zidx", 'rb') as f: raw = f.read()
+        entries = [record.unpack_from(raw, n) for n in range(0, len(raw) - record.size + 1, record.size)] or [(int(name) / 1000, 0, 0)]
+        first = max(0, bisect.bisect_right([e[0] for e in entries], start_ts) - 1)
+        last = bisect.bisect_right([e[0] for e in entries], end_ts)
+        if kind == 'raw':
+            with open(f"{base}.log", 'rb') as f:
+                f.seek(entries[first][1])
+                end = entries[last][1] if last < len(entries) else None
+                yield f.read(end - entries[first][1]) if end is not None else f.read()
+            return
+        with open(f"{base}.log.z", 'rb') as f:
+            for n in range(first, max(first + 1, last)):
+                f.seek(entries[n][2])
+                end = entries[n + 1][2] if n + 1 < len(entries) else None
+                yield zlib.decompress(f.read(end - entries[n][2]) if end is not None else f.read())
+
+    def read(self, stream, start_ts, end_ts, max_bytes=LOG_READ_MAX_BYTES):
+        if stream in self.active: self.flush()
+        directory = self.stream_dir(stream)
+        segments = self.segments_in(directory)
+        start_stamp, end_stamp = log_stamp(start_ts), log_stamp(end_ts)
+        out, size, keep = [], 0, False
+        for n, (name, kind) in enumerate(segments):
+            seg_start = int(name) / 1000
+            seg_end = int(segments[n + 1][0]) / 1000 if n + 1 < len(segments) else float('inf')
+            if seg_end < start_ts or seg_start > end_ts: continue
+            try:
+                for block in self._blocks(directory, name, kind, start_ts, end_ts):
+                    for line in block.decode('utf-8', errors='replace').splitlines(keepends=True):
+                        if line.startswith('[') and line[20:22] == '] ': keep = start_stamp <= line[1:20] <= end_stamp
+                        if not keep: continue
+                        if size + len(line) > max_bytes: return {'text': ''.join(out), 'truncated': True}
+                        out.append(line); size += len(line)
+            except OSError: continue  # Compressed and replaced while we were reading.
+        return {'text': ''.join(out), 'truncated': False}
+
+    def discard(self, stream):
+        with self.write_lock, self.lock:
+            self.pending.pop(stream, None); self.line_start.pop(stream, None)
+            segment = self.active.pop(stream, None)
+            if segment: segment['file'].close(); segment['index'].close()
+        shutil.rmtree(self.stream_dir(stream), ignore_errors=True)
+
+console_logs = ConsoleLogWriter()
+
+def emit_console(server_id, text):
+    console_pipeline.write(server_id, text)
+    console_logs.append(server_id, text)
+
+# --- Pipe Multiplexer ---
+# One thread owns the stdout, stderr and stdin pipes of every server, so the thread count doesn't grow
+# with the fleet. Output pipes are non-blocking and read PIPE_READ_SIZE at a time; each read is cut at
+# its last newline and the complete lines are handed on as one block, the remainder waits for the next
+# read. Newlines are normalized as text-mode pipes would. Commands are queued and written whenever the
+# server's stdin has room. POSIX uses a selector; Windows pipes can't be selected, so there the same
+# thread polls them with PeekNamedPipe. Windows stdin pipes can't be made non-blocking either, so there
+# queued commands are written by a short-lived thread per server that exits once its queue is empty; a
+# server that never reads its stdin only stalls its own commands, never the console output.
+PIPE_READ_SIZE = 64 * 1024
+PIPE_MAX_PARTIAL = 64 * 1024  # A longer unterminated line is passed on as is.
+PIPE_POLL_INTERVAL = 0.02
+
+class PipeMultiplexer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.readers = {}  # fd -> reader state
+        self.writers = {}  # server_id -> {'fd', 'process', 'buffer'}
+        self.tasks = deque()  # selector changes, applied on the loop thread
+        self.selector = None if kernel32 else selectors.DefaultSelector()
+        if self.selector:
+            self.wake_r, self.wake_w = os.pipe()
+            for fd in (self.wake_r, self.wake_w): os.set_blocking(fd, False)
+            self.selector.register(self.wake_r, selectors.EVENT_READ)
+
+    def add(self, server_id, process, on_output, on_close=None):
+        # on_output(server_id, text) gets whole-line blocks; on_close(server_id, process) runs once both outputs hit EOF.
+        state = {'process': process, 'open': 2}
+        for pipe in (process.stdout, process.stderr):
+            reader = {'server_id': server_id, 'pipe': pipe, 'state': state, 'on_output': on_output, 'on_close': on_close,
+                      'decoder': codecs.getincrementaldecoder('utf-8')('replace'), 'carry': ''}
+            if kernel32: reader['handle'] = msvcrt.get_osfhandle(pipe.fileno())
+            else: os.set_blocking(pipe.fileno(), False)
+            self._call(self._add_reader, pipe.fileno(), reader)
+        if not kernel32: os.set_blocking(process.stdin.fileno(), False)
+        with self.lock: self.writers[server_id] = {'fd': process.stdin.fileno(), 'process': process, 'buffer': bytearray()}
+
+    def write(self, server_id, text):
+        with self.lock:
+            writer = self.writers.get(server_id)
+            if not writer: return False
+            wake = not writer['buffer']
+            writer['buffer'] += text.encode('utf-8', errors='replace')
+        if not wake: return True
+        if kernel32: threading.Thread(target=self._write_blocking, args=(writer,), name=f'stdin-{server_id}', daemon=True).start()
+        else: self._call(self._want_write, writer)
+        return True
+
+    def _write_blocking(self, writer):
+        # Windows only: runs until the writer's buffer is drained. write() starts it only when the buffer
+        # was empty, and the buffer is only emptied here, so at most one runs per writer.
+        while not writer.get('closed') and not self._flush_writer(writer): pass
+
+    def _call(self, task, *args):
+        self.tasks.append((task, args))
+        if self.selector:
+            try: os.write(self.wake_w, b'\0')
+            except BlockingIOError: pass
+
+    def _add_reader(self, fd, reader):
+        self.readers[fd] = reader
+        if self.selector: self.selector.register(fd, selectors.EVENT_READ, reader)
+
+    def _want_write(self, writer):
+        if not self.selector or writer.get('closed'): return
+        try: self.selector.register(writer['fd'], selectors.EVENT_WRITE, writer)
+        except KeyError: pass  # Already waiting for room.
+        except (ValueError, OSError): self._drop_writer(writer)
+
+    def _feed(self, fd, reader, data):
+        text = reader['carry'] + reader['decoder'].decode(data, final=not data)
+        held = '\r' if data and text.endswith('\r') else ''  # May be the first half of a \r\n.
+        if held: text = text[:-1]
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        cut = text.rfind('\n') + 1 if data and len(text) <= PIPE_MAX_PARTIAL else len(text)
+        reader['carry'] = text[cut:] + held
+        if cut: reader['on_output'](reader['server_id'], text[:cut])
+        if data: return
+        del self.readers[fd]
+        if self.selector: self.selector.unregister(fd)
+        reader['pipe'].close()
+        state = reader['state']
+        state['open'] -= 1
+        if state['open'] == 0:
+            with self.lock: writer = self.writers.get(reader['server_id'])
+            if writer and writer['process'] is state['process']: self._drop_writer(writer)
+            if reader['on_close']: reader['on_close'](reader['server_id'], state['process'])
+
+    def _flush_writer(self, writer):
+        with self.lock: data = bytes(writer['buffer'])
+        try: written = os.write(writer['fd'], data) if data else 0
+        except BlockingIOError: written = 0
+        except OSError as e:
+            for server_id in self._drop_writer(writer): emit_console(server_id, f'\n--- Error: {e} ---\n')
+            return False
+        with self.lock:
+            del writer['buffer'][:written]
+            return not writer['buffer']
+
+    def _drop_writer(self, writer):
+        # Runs on the loop thread (or a Windows stdin thread). Returns the server ids the writer belonged to.
+        with self.lock:
+            writer['buffer'].clear(); writer['closed'] = True
+            server_ids = [sid for sid, w in self.writers.items() if w is writer]
+            for server_id in server_ids: del self.writers[server_id]
+        if self.selector:
+            try: self.selector.unregister(writer['fd'])
+            except (KeyError, ValueError): pass
+        try: writer['process'].stdin.close()
+        except OSError: pass
+        return server_ids
+
+    def run(self):
+        while True:
+            try: self._run_selector() if self.selector else self._run_polling()
+            except Exception as e: print(f"PIPES: loop error: {e}")
+
+    def _run_tasks(self):
+        while self.tasks:
+            task, args = self.tasks.popleft()
+            task(*args)
+
+    def _run_selector(self):
+        while True:
+            self._run_tasks()
+            for key, events in self.selector.select():
+                if key.fd == self.wake_r:
+                    try:
+                        while os.read(self.wake_r, 4096): pass
+                    except BlockingIOError: pass
+                elif events & selectors.EVENT_WRITE:
+                    if self._flush_writer(key.data) and not key.data.get('closed'): self.selector.unregister(key.fd)
+                else:
+                    try: data = os.read(key.fd, PIPE_READ_SIZE)
+                    except BlockingIOError: continue
+                    except OSError: data = b''
+                    self._feed(key.fd, key.data, data)
+
+    def _peek(self, handle):
+        available = ctypes.c_ulong(0)
+        if not kernel32.PeekNamedPipe(handle, None, 0, None, ctypes.byref(available), None): return -1  # Closed.
+        return available.value
+
+    def _run_polling(self):
+        while True:
+            self._run_tasks()
+            busy = False
+            for fd, reader in list(self.readers.items()):
+                available = self._peek(reader['handle'])
+                if available:
+                    busy = True
+                    self._feed(fd, reader, os.read(fd, min(available, PIPE_READ_SIZE)) if available > 0 else b'')
+            if not busy: time.sleep(PIPE_POLL_INTERVAL)
+
+pipe_mux = PipeMultiplexer()
+
 # --- Background Threads & Process Helpers ---
-def read_stream(stream, server_id):
-    while True:
-        line = stream.readline()
-        if not line: break
-        socketio.emit('console_output', {'id': server_id, 'data': line})
+def handle_server_output(server_id, text):
+    emit_console(server_id, text)
+    lifecycle.on_output(server_id, text)
 
-def read_installer_stream(stream, context_id):
-    global steam_process
-    while True:
-        line = stream.readline()
-        if not line: break
-        socketio.emit('installer_output', {'data': line, 'context_id': context_id})
-    if steam_process and steam_process.poll() is not None:
-        steam_process = None
-        socketio.emit('installer_output', {'data': '\n--- Process Finished! ---\n', 'context_id': context_id})
+# --- SteamCMD Job Queue ---
+# Installs and updates are queued as jobs in steam_jobs.json and run by up to 'steamcmd_workers'
+# (config) SteamCMD processes at once. Jobs for the same appid + install dir never run concurrently,
+# and a request for a target that is already queued is merged into the queued job. Jobs that were
+# queued or running when the panel stopped are queued again on start. Progress lines are parsed into
+# 'installer_progress' events; the rest of the output still goes to 'installer_output'.
+STEAMCMD_DEFAULT_WORKERS = 2
+STEAMCMD_MAX_WORKERS = 8
+STEAMCMD_JOB_HISTORY = 50
+STEAMCMD_PROGRESS_INTERVAL = 0.5
+STEAMCMD_PROGRESS_RE = re.compile(r'Update state \(0x[0-9a-fA-F]+\) ([^,]+), progress: ([\d.]+) \((\d+) / (\d+)\)')
+STEAMCMD_SUCCESS_RE = re.compile(r"Success! App '\d+' (fully installed|already up to date)")
+
+def parse_steamcmd_progress(line):
+    match = STEAMCMD_PROGRESS_RE.search(line)
+    if not match: return None
+    return {'state': match.group(1).strip(), 'percent': float(match.group(2)), 'bytes_done': int(match.group(3)), 'bytes_total': int(match.group(4))}
+
+class SteamJobQueue:
+    def __init__(self, store):
+        self.store = store
+        self.cond = threading.Condition()
+        self.jobs, self.queue, self.active = {}, [], set()  # all jobs by id, queued ids (FIFO), running targets
+
+    def worker_limit(self):
+        try: return max(1, min(STEAMCMD_MAX_WORKERS, int(load_config().get('steamcmd_workers', STEAMCMD_DEFAULT_WORKERS))))
+        except (TypeError, ValueError): return STEAMCMD_DEFAULT_WORKERS
+
+    def start(self):
+        with self.cond:
+            for job in self.store.get():
+                job = dict(copy.deepcopy(job), progress=None); job.setdefault('servers', [])  # Store data is read-only.
+                if job['status'] in ('queued', 'running'):
+                    job['status'] = 'queued'; self.queue.append(job['id'])
+                self.jobs[job['id']] = job
+            self._persist()
+        for i in range(STEAMCMD_MAX_WORKERS):
+            threading.Thread(target=self._worker, name=f'steamcmd-{i}', daemon=True).start()
+
+    def submit(self, kind, appid, install_dir, name, context_id, server_id=None):
+        # Returns (job, merged). server_id marks the job as a shared depot update (see materialize_server).
+        target = [str(appid), os.path.normcase(os.path.abspath(install_dir))]
+        servers = [server_id] if server_id else []
+        with self.cond:
+            for job_id in self.queue:
+                job = self.jobs[job_id]
+                if job['target'] == target:
+                    if context_id not in job['contexts']: job['contexts'].append(context_id)
+                    job['servers'] += [sid for sid in servers if sid not in job['servers']]
+                    self._persist()
+                    return job, True
+            job = {
+                'id': f"job_{int(time.time() * 1000)}_{len(self.jobs)}", 'kind': kind, 'appid': str(appid), 'install_dir': target[1],
+                'name': name, 'target': target, 'contexts': [context_id], 'servers': servers, 'status': 'queued', 'error': None,
+                'created_at': datetime.now().isoformat(timespec='seconds'), 'started_at': None, 'finished_at': None, 'progress': None
+            }
+            self.jobs[job['id']] = job; self.queue.append(job['id'])
+            self._persist()
+            self.cond.notify()
+        self._publish(job)
+        return job, False
+
+    def position(self, job):
+        with self.cond: return self.queue.index(job['id']) + 1 if job['id'] in self.queue else 0
+
+    def snapshot(self):
+        with self.cond: return [dict(job, position=self.position(job)) for job in self.jobs.values()]
+
+    def wait(self, job, timeout=None):
+        deadline = time.monotonic() + timeout if timeout else None
+        with self.cond:
+            while job['status'] not in ('done', 'failed'):
+                if deadline and time.monotonic() >= deadline: return False
+                self.cond.wait(timeout=5)
+        return True
+
+    def _persist(self):
+        # Called with self.cond held. Finished jobs beyond the history limit are dropped.
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - STEAMCMD_JOB_HISTORY)]: del self.jobs[job_id]
+        records = [copy.deepcopy({k: v for k, v in job.items() if k != 'progress'}) for job in self.jobs.values()]
+        def apply(jobs): jobs[:] = records
+        self.store.update(apply)
+
+    def _publish(self, job):
+        socketio.emit('job_update', dict(job, position=self.position(job)))
+
+    def _output(self, job, text):
+        console_logs.append('steamcmd', text)
+        for context_id in job['contexts']: socketio.emit('installer_output', {'data': text, 'context_id': context_id})
+
+    def _claim(self):
+        with self.cond:
+            while True:
+                if len(self.active) < self.worker_limit():
+                    for job_id in self.queue:
+                        job = self.jobs[job_id]
+                        if tuple(job['target']) in self.active: continue
+                        self.queue.remove(job_id); self.active.add(tuple(job['target']))
+                        job.update(status='running', started_at=datetime.now().isoformat(timespec='seconds'))
+                        self._persist()
+                        return job
+                self.cond.wait(timeout=5)  # Also picks up changes to steamcmd_workers.
+
+    def _worker(self):
+        while True:
+            job = self._claim()
+            self._publish(job)
+            try: status, error = self._run(job)
+            except Exception as e: status, error = 'failed', str(e)
+            with self.cond:
+                self.active.discard(tuple(job['target']))
+                job.update(status=status, error=error, finished_at=datetime.now().isoformat(timespec='seconds'))
+                self._persist()
+                self.cond.notify_all()
+            self._output(job, '\n--- Process Finished! ---\n' if status == 'done' else f'\n--- SteamCMD job failed: {error} ---\n')
+            self._publish(job)
+
+    def _run(self, job):
+        steam_path = load_config().get('steamcmd_path')
+        if not steam_path or not os.path.exists(steam_path): return 'failed', 'SteamCMD path invalid. Check Settings.'
+        os.makedirs(job['install_dir'], exist_ok=True)
+        self._output(job, f"--- Starting SteamCMD {job['kind']} for {job['name']} ---\n")
+        steam_cmd = [steam_path, '+force_install_dir', job['install_dir'], '+login', 'anonymous', '+app_update', job['appid'], 'validate', '+quit']
+        process = subprocess.Popen(steam_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace')
+        succeeded, last_emit, last_sample = False, 0.0, None
+        for line in process.stdout:
+            progress = parse_steamcmd_progress(line)
+            if progress is None:
+                succeeded = succeeded or bool(STEAMCMD_SUCCESS_RE.search(line))
+                self._output(job, line)
+                continue
+            now = time.monotonic()
+            if last_sample and progress['bytes_done'] >= last_sample[1] and now > last_sample[0]:
+                progress['rate'] = round((progress['bytes_done'] - last_sample[1]) / (now - last_sample[0]))
+            else: progress['rate'] = (job['progress'] or {}).get('rate', 0)
+            last_sample, job['progress'] = (now, progress['bytes_done']), progress
+            if now - last_emit >= STEAMCMD_PROGRESS_INTERVAL:
+                last_emit = now
+                socketio.emit('installer_progress', dict(progress, job_id=job['id'], context_ids=job['contexts']))
+        code = process.wait()
+        # SteamCMD's exit code is unreliable (e.g. 7 after a self-update), so its success line counts too.
+        if code != 0 and not succeeded: return 'failed', f'SteamCMD exited with code {code}'
+        failed = [sid for sid in job.get('servers', []) if not self._materialize(job, sid)]
+        if failed: return 'failed', f"Could not relink {', '.join(failed)}"
+        return 'done', None
+
+    def _materialize(self, job, server_id):
+        server_config = get_server_config(server_id)
+        if not server_config:
+            self._output(job, f"--- Skipping '{server_id}': server no longer exists. ---\n"); return True
+        try:
+            started = time.perf_counter()
+            result = materialize_server(job['install_dir'], server_config['cwd'], server_private_paths(server_config))
+            via = f" via {result['method']}" if result['linked'] else ''
+            self._output(job, f"--- {server_config['name']}: {result['linked']} files linked{via}, {result['unchanged']} unchanged, "
+                              f"{result['private']} private copies, {result['removed']} removed in {time.perf_counter() - started:.1f}s ---\n")
+            return True
+        except Exception as e:
+            self._output(job, f"--- {server_config['name']}: relink failed: {e} ---\n"); return False
+
+steam_jobs = SteamJobQueue(steam_jobs_store)
+
+# --- Shared Depot Cache ---
+# With 'shared_depots' enabled, SteamCMD installs/updates each appid once into a master copy under
+# depots/<appid>, and every server of that appid is materialized from it: game files are reflinked
+# (or hardlinked, or copied as a last resort) into the server directory, while the server's private
+# paths (its 'private_paths' plus its snapshot save paths) get their own copy and are never
+# overwritten. Hardlinked files share the master's data, so anything a server writes to must be
+# listed as private; the panel's own editor always saves through a temp file and os.replace, which
+# gives the server its own copy instead of writing through the link. The list of linked files is kept in each server directory so files dropped
+# from the depot by an update are removed again.
+DEPOT_DIR = 'depots'
+DEPOT_STATE_FILE = '.pulse_depot.json'
+DEPOT_SKIP_TOP = ('steamapps', 'backups')
+
+def shared_depots_enabled():
+    return bool(load_config().get('shared_depots'))
+
+def depot_path(appid):
+    return os.path.abspath(os.path.join(load_config().get('depot_dir') or DEPOT_DIR, str(appid)))
+
+def server_private_paths(server_config):
+    paths = [p.strip().replace('\\', '/').strip('/') for p in server_config.get('private_paths') or [] if p.strip()]
+    return paths + [p for p in snapshot_settings(server_config)['save_paths'] if p not in paths]
+
+def materialize_server(depot, server_dir, private_paths):
+    state_path = os.path.join(server_dir, DEPOT_STATE_FILE)
+    previous = set(load_json_file(state_path))
+    files, dirs = scan_tree(depot, skip_top=DEPOT_SKIP_TOP)
+    result, linked, method = {'linked': 0, 'unchanged': 0, 'private': 0, 'removed': 0}, [], 'reflink' if fcntl else 'hardlink'
+    os.makedirs(server_dir, exist_ok=True)
+    for rel in dirs: os.makedirs(os.path.join(server_dir, rel), exist_ok=True)
+    for rel, st in files:
+        src, dst = os.path.join(depot, rel), os.path.join(server_dir, rel)
+        if private_paths and is_under(rel, private_paths):
+            if not os.path.exists(dst): shutil.copy2(src, dst); result['private'] += 1
+            continue
+        linked.append(rel)
+        try: current = os.stat(dst)
+        except FileNotFoundError: current = None
+        # Links and reflinks/copies (via copystat) carry the master's size and mtime, so a match means up to date.
+        if current and current.st_size == st.st_size and current.st_mtime_ns == st.st_mtime_ns:
+            result['unchanged'] += 1; continue
+        tmp_path = f"{dst}.pplink"
+        if os.path.lexists(tmp_path): os.remove(tmp_path)
+        method = clone_file(src, tmp_path, method)
+        os.replace(tmp_path, dst)
+        result['linked'] += 1
+    for rel in previous - set(linked):
+        path = resolve_inside(server_dir, rel)
+        if path and os.path.isfile(path) and not (private_paths and is_under(rel, private_paths)):
+            os.remove(path); result['removed'] += 1
+    save_json_file(state_path, sorted(linked), indent=None)
+    result['method'] = method
+    return result
 
 def _start_server_process(server_id, config):
     try:
-        socketio.emit('console_output', {'id': server_id, 'data': f'--- Starting server: {config["name"]} ---\n'})
-        process = subprocess.Popen(config['start_command'], cwd=config['cwd'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, shell=True, text=True, encoding='utf-8', errors='replace', creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == 'win32' else 0)
+        emit_console(server_id, f'--- Starting server: {config["name"]} ---\n')
+        process = subprocess.Popen(config['start_command'], cwd=config['cwd'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, shell=True, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == 'win32' else 0)
         server_processes[server_id] = {'process': process}
-        for stream in [process.stdout, process.stderr]: threading.Thread(target=read_stream, args=(stream, server_id), daemon=True).start()
+        pipe_mux.add(server_id, process, handle_server_output, lifecycle.process_closed)
         return True
     except Exception as e:
-        socketio.emit('console_output', {'id': server_id, 'data': f'\n--- FATAL ERROR: {e} ---\nCheck CWD and start command!\n'})
+        emit_console(server_id, f'\n--- FATAL ERROR: {e} ---\nCheck CWD and start command!\n')
         return False
 
-def _stop_server_process(server_id):
-    if server_id in server_processes:
-        process = server_processes[server_id]['process']
-        socketio.emit('console_output', {'id': server_id, 'data': '\n--- Sending stop command... ---\n'})
+def write_server_stdin(server_id, command):
+    if server_id not in server_processes or server_processes[server_id]['process'].poll() is not None: return False
+    return pipe_mux.write(server_id, command + os.linesep)
+
+# --- Server Lifecycle ---
+# Each server moves through offline -> starting -> ready -> stopping -> offline, or to crashed when its
+# process exits on its own. A start is ready once its readiness probe passes: a TCP port accepting
+# connections, a UDP port bound by the server's process tree, or a console line matching a regex (no
+# probe means ready at once).
+# Stops send the server's stop commands through stdin and escalate to terminate, then kill, from the
+# lifecycle thread, so no handler ever waits on a process. With auto_restart a crashed server is started
+# again after an exponential backoff; the count resets once a run has stayed ready for a while.
+LIFECYCLE_TICK = 1.0
+LIFECYCLE_EXIT_TICK = 0.05  # While a process whose pipes closed hasn't been reaped yet.
+LIFECYCLE_EXIT_GRACE = 5
+LIFECYCLE_STOP_TIMEOUT = 30
+LIFECYCLE_KILL_TIMEOUT = 10
+LIFECYCLE_READY_TIMEOUT = 300
+LIFECYCLE_BACKOFF_BASE = 5
+LIFECYCLE_BACKOFF_MAX = 300
+LIFECYCLE_STABLE_AFTER = 600
+LIFECYCLE_MAX_RESTARTS = 10
+PROBE_TYPES = ('none', 'tcp', 'udp', 'log')
+
+def lifecycle_settings(server_config):
+    lifecycle = server_config.get('lifecycle') or {}
+    probe = lifecycle.get('probe') or {}
+    commands = lifecycle.get('stop_commands') or []
+    if isinstance(commands, str): commands = commands.splitlines()
+    def seconds(key, default):
+        try: return max(0.0, float(lifecycle.get(key, default)))
+        except (TypeError, ValueError): return default
+    try: port = int(probe.get('port') or 0)
+    except (TypeError, ValueError): port = 0
+    probe_type = probe.get('type') if probe.get('type') in PROBE_TYPES else 'none'
+    if (probe_type in ('tcp', 'udp') and not 0 < port < 65536) or (probe_type == 'log' and not probe.get('pattern')): probe_type = 'none'
+    return {
+        'stop_commands': [c.strip() for c in commands if c.strip()], 'stop_timeout': seconds('stop_timeout', LIFECYCLE_STOP_TIMEOUT),
+        'ready_timeout': seconds('ready_timeout', LIFECYCLE_READY_TIMEOUT), 'auto_restart': bool(lifecycle.get('auto_restart')),
+        'probe': {'type': probe_type, 'host': probe.get('host') or '127.0.0.1', 'port': port, 'pattern': probe.get('pattern') or ''}
+    }
+
+PROBE_ANY_ADDRESSES = ('', '0.0.0.0', '::')
+
+def probe_port(kind, host, port, process=None):
+    if kind == 'tcp':
         try:
-            if sys.platform == 'win32': process.send_signal(subprocess.CTRL_C_EVENT)
-            else: process.terminate()
-            process.wait(timeout=10)
-        except subprocess.TimeoutExpired:
-            socketio.emit('console_output', {'id': server_id, 'data': '\n--- Forcing termination... ---\n'}); process.kill()
-        if server_id in server_processes: del server_processes[server_id]
+            with socket.create_connection((host, port), timeout=0.5): return True
+        except OSError: return False
+    # A UDP port can't be probed without speaking the game's protocol, so it counts as open once the
+    # server's process tree has bound it on the probe host (or on all addresses). Only the sockets are
+    # inspected; binding the port ourselves could take it from the server.
+    if process is None: return False
+    try:
+        root = psutil.Process(process.pid)
+        tree = [root] + root.children(recursive=True)
+    except psutil.Error: return False
+    for proc in tree:
+        try: connections = proc.net_connections(kind='udp')
+        except psutil.Error: continue
+        for conn in connections:
+            if conn.laddr and conn.laddr.port == port and (conn.laddr.ip == host or conn.laddr.ip in PROBE_ANY_ADDRESSES or host in PROBE_ANY_ADDRESSES): return True
+    return False
 
-def monitor_servers():
-    all_server_configs = load_json_file(SERVERS_FILE)
-    for s in all_server_configs:
-        server_id = s['id']
-        if server_id not in performance_data:
-            performance_data[server_id] = {
-                "cpu": deque([0] * MAX_PERF_DATA_POINTS, maxlen=MAX_PERF_DATA_POINTS),
-                "mem": deque([0] * MAX_PERF_DATA_POINTS, maxlen=MAX_PERF_DATA_POINTS)
+def interrupt_process(process):
+    if sys.platform == 'win32': process.send_signal(subprocess.CTRL_C_EVENT)
+    else: process.terminate()
+
+class ServerLifecycle:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.wakeup = threading.Event()
+        self.servers = {}
+        self.closing = {}  # process -> deadline for fast exit checks
+
+    def _entry(self, server_id):
+        return self.servers.setdefault(server_id, {
+            'state': 'offline', 'process': None, 'probe': None, 'pattern': None, 'started': 0.0, 'ready_since': None, 'warned': False,
+            'stop_phase': None, 'stop_deadline': 0.0, 'restart': False, 'restart_at': None, 'crashes': 0
+        })
+
+    def state(self, server_id):
+        entry = self.servers.get(server_id)
+        return entry['state'] if entry else 'offline'
+
+    def wait(self, server_id, states, timeout=None):
+        with self.cond: return self.cond.wait_for(lambda: self.state(server_id) in states, timeout)
+
+    def _set(self, server_id, entry, state, message=None):
+        entry['state'] = state
+        self.cond.notify_all()
+        if message: emit_console(server_id, message)
+
+    def start(self, server_id, config=None):
+        config = config or get_server_config(server_id)
+        if not config: return False
+        with self.cond:
+            entry = self._entry(server_id)
+            if entry['process'] and entry['process'].poll() is None: return False
+            settings = lifecycle_settings(config)
+            probe, pattern = settings['probe'], None
+            if probe['type'] == 'log':
+                try: pattern = re.compile(probe['pattern'], re.MULTILINE)
+                except re.error as e:
+                    emit_console(server_id, f'--- Invalid readiness pattern ({e}); not waiting for it. ---\n'); probe = dict(probe, type='none')
+            entry.update(probe=probe, pattern=pattern, started=time.monotonic(), ready_since=None, warned=False, stop_phase=None, restart=False, restart_at=None)
+            self._set(server_id, entry, 'starting')
+            if not _start_server_process(server_id, config):
+                entry['process'] = None
+                self._set(server_id, entry, 'crashed'); return False
+            entry['process'] = server_processes[server_id]['process']
+            if probe['type'] == 'none': self._ready(server_id, entry, 'no readiness probe')
+            return True
+
+    def _ready(self, server_id, entry, how):
+        entry['ready_since'] = time.monotonic()
+        self._set(server_id, entry, 'ready', f"--- Server is ready ({how}) after {entry['ready_since'] - entry['started']:.1f}s ---\n")
+
+    def stop(self, server_id, restart=False):
+        with self.cond:
+            entry = self._entry(server_id)
+            entry['restart_at'] = None
+            process = entry['process']
+            if not process or process.poll() is not None:
+                if restart: return self.start(server_id)
+                if entry['state'] == 'crashed': self._set(server_id, entry, 'offline')
+                return False
+            entry['restart'] = entry['restart'] or restart
+            if entry['state'] == 'stopping': return True
+            config = get_server_config(server_id) or {}
+            commands = lifecycle_settings(config)['stop_commands']
+            self._set(server_id, entry, 'stopping', '\n--- Sending stop command... ---\n')
+            if commands:
+                entry.update(stop_phase='command', stop_deadline=time.monotonic() + lifecycle_settings(config)['stop_timeout'])
+            else:
+                interrupt_process(process)
+                entry.update(stop_phase='terminate', stop_deadline=time.monotonic() + LIFECYCLE_KILL_TIMEOUT)
+        for command in commands: write_server_stdin(server_id, command)
+        return True
+
+    def restart(self, server_id):
+        return self.stop(server_id, restart=True)
+
+    def process_closed(self, server_id, process):
+        # The pipe multiplexer saw the output pipes close; the exit usually follows within milliseconds.
+        with self.cond: self.closing[process] = time.monotonic() + LIFECYCLE_EXIT_GRACE
+        self.wakeup.set()
+
+    def _exited(self, server_id, process, code):
+        with self.cond:
+            entry = self._entry(server_id)
+            if entry['process'] is not process: return
+            entry['process'] = None
+            if server_processes.get(server_id, {}).get('process') is process: del server_processes[server_id]
+            if entry['state'] == 'stopping':
+                self._set(server_id, entry, 'offline', '--- Server stopped ---\n')
+                if entry['restart']: self.start(server_id)
+                return
+            now = time.monotonic()
+            if entry['ready_since'] and now - entry['ready_since'] >= LIFECYCLE_STABLE_AFTER: entry['crashes'] = 0
+            entry['crashes'] += 1
+            self._set(server_id, entry, 'crashed', f'\n--- Server Stopped Unexpectedly (exit code {code}) ---\n')
+            if not lifecycle_settings(get_server_config(server_id) or {})['auto_restart']: return
+            if entry['crashes'] > LIFECYCLE_MAX_RESTARTS:
+                emit_console(server_id, f"--- Not restarting: crashed {entry['crashes']} times in a row ---\n"); return
+            delay = min(LIFECYCLE_BACKOFF_MAX, LIFECYCLE_BACKOFF_BASE * 2 ** (entry['crashes'] - 1))
+            entry['restart_at'] = now + delay
+            emit_console(server_id, f"--- Restarting in {delay}s (attempt {entry['crashes']}/{LIFECYCLE_MAX_RESTARTS}) ---\n")
+
+    def on_output(self, server_id, line):
+        # Called for every console line, so the common case is a dict lookup and a comparison.
+        entry = self.servers.get(server_id)
+        if not entry or entry['state'] != 'starting' or not entry['pattern'] or not entry['pattern'].search(line): return
+        with self.cond:
+            if entry['state'] == 'starting': self._ready(server_id, entry, 'console matched')
+
+    def _tick(self):
+        now, probes, restarts = time.monotonic(), [], []
+        with self.cond:
+            for server_id, entry in list(self.servers.items()):
+                process = entry['process']
+                if process and process.poll() is not None:
+                    self._exited(server_id, process, process.returncode); continue
+                if entry['state'] == 'starting' and process:
+                    if entry['probe']['type'] in ('tcp', 'udp'): probes.append((server_id, process, entry['probe']))
+                    if not entry['warned'] and now - entry['started'] > lifecycle_settings(get_server_config(server_id) or {})['ready_timeout']:
+                        entry['warned'] = True
+                        emit_console(server_id, f"--- Server not ready after {now - entry['started']:.0f}s; still waiting ---\n")
+                elif entry['state'] == 'stopping' and process and now >= entry['stop_deadline']:
+                    if entry['stop_phase'] == 'command':
+                        emit_console(server_id, '\n--- Stop commands timed out, terminating... ---\n')
+                        interrupt_process(process)
+                        entry.update(stop_phase='terminate', stop_deadline=now + LIFECYCLE_KILL_TIMEOUT)
+                    elif entry['stop_phase'] == 'terminate':
+                        emit_console(server_id, '\n--- Forcing termination... ---\n')
+                        process.kill()
+                        entry['stop_phase'] = 'kill'
+                elif entry['state'] == 'crashed' and entry['restart_at'] and now >= entry['restart_at']:
+                    entry['restart_at'] = None; restarts.append(server_id)
+            for process, deadline in list(self.closing.items()):
+                if process.poll() is not None or now >= deadline: del self.closing[process]
+            for server_id in restarts: self.start(server_id)
+        for server_id, process, probe in probes:
+            if not probe_port(probe['type'], probe['host'], probe['port'], process): continue
+            with self.cond:
+                entry = self.servers.get(server_id)
+                if entry and entry['process'] is process and entry['state'] == 'starting':
+                    self._ready(server_id, entry, f"{probe['type'].upper()} port {probe['port']} open")
+
+    def discard(self, server_id):
+        with self.cond:
+            entry = self.servers.get(server_id)
+            if entry and not entry['process']: del self.servers[server_id]
+
+    def run(self):
+        while True:
+            try: self._tick()
+            except Exception as e: print(f"LIFECYCLE: tick failed: {e}")
+            self.wakeup.wait(LIFECYCLE_EXIT_TICK if self.closing else LIFECYCLE_TICK)
+            self.wakeup.clear()
+
+lifecycle = ServerLifecycle()
+
+# --- Download Manager ---
+# Artifacts (SteamCMD itself, later mods and workshop items) are streamed to a .part file in the download
+# cache, hashed as they arrive and moved into place once complete. An interrupted download resumes with a
+# Range request (guarded by If-Range, so a changed file starts over). Downloads with a known sha256 are
+# stored by content hash; others are cached by URL and reused unless refresh is requested.
+DOWNLOAD_CACHE_DIR = 'downloads'
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_TIMEOUT = (10, 60)
+DOWNLOAD_PROGRESS_INTERVAL = 0.5
+STEAMCMD_URL = 'https://steamcdn-a.akamaihd.net/client/installer/steamcmd.zip'
+
+class DownloadError(Exception):
+    pass
+
+class DownloadManager:
+    def __init__(self, cache_dir, session=None):
+        self.cache_dir, self.session = cache_dir, session or requests.Session()
+        self.locks, self.locks_guard = {}, threading.Lock()
+
+    def cache_path(self, url, sha256=None):
+        name = os.path.basename(urlparse(url).path) or 'download'
+        if sha256: return os.path.join(self.cache_dir, 'sha256', f"{sha256.lower()}-{name}")
+        return os.path.join(self.cache_dir, 'url', f"{hashlib.sha256(url.encode()).hexdigest()[:32]}-{name}")
+
+    def _lock(self, path):
+        with self.locks_guard: return self.locks.setdefault(path, threading.Lock())
+
+    def fetch(self, url, sha256=None, progress=None, refresh=False):
+        # Returns (path, from_cache). progress(bytes_done, bytes_total or None, rate) is called while downloading.
+        path = self.cache_path(url, sha256)
+        with self._lock(path):
+            if os.path.exists(path) and not refresh: return path, True
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            for attempt in range(DOWNLOAD_RETRIES):
+                try:
+                    digest = self._download(url, f"{path}.part", progress)
+                    break
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == DOWNLOAD_RETRIES - 1: raise DownloadError(f"Download failed after {DOWNLOAD_RETRIES} attempts: {e}")
+                    time.sleep(2 ** attempt)
+            if sha256 and digest != sha256.lower():
+                os.remove(f"{path}.part"); self._forget(f"{path}.part")
+                raise DownloadError(f"Checksum mismatch for {url}: expected {sha256}, got {digest}")
+            os.replace(f"{path}.part", path); self._forget(f"{path}.part")
+            save_json_file(f"{path}.json", {'url': url, 'sha256': digest, 'size': os.path.getsize(path), 'fetched_at': datetime.now().isoformat(timespec='seconds')})
+            return path, False
+
+    def _forget(self, part_path):
+        try: os.remove(f"{part_path}.json")
+        except OSError: pass
+
+    def _download(self, url, part_path, progress):
+        meta = load_json_file(f"{part_path}.json", is_dict=True)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) and meta.get('url') == url else 0
+        headers = {}
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+            if meta.get('validator'): headers['If-Range'] = meta['validator']
+        with self.session.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as r:
+            if r.status_code == 416: offset = 0; r.close(); return self._restart(url, part_path, progress)
+            r.raise_for_status()
+            if r.status_code != 206: offset = 0  # Server ignored the Range (or the file changed): start over.
+            length = r.headers.get('Content-Length')
+            total = offset + int(length) if length and length.isdigit() else None
+            save_json_file(f"{part_path}.json", {'url': url, 'validator': r.headers.get('ETag') or r.headers.get('Last-Modified')}, indent=None)
+            hasher = hashlib.sha256()
+            if offset:
+                with open(part_path, 'rb') as f:
+                    while data := f.read(DOWNLOAD_CHUNK_SIZE): hasher.update(data)
+            done, started, last_emit = offset, time.monotonic(), 0.0
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for data in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(data); hasher.update(data); done += len(data)
+                    now = time.monotonic()
+                    if progress and now - last_emit >= DOWNLOAD_PROGRESS_INTERVAL:
+                        last_emit = now
+                        progress(done, total, (done - offset) / max(now - started, 1e-6))
+            if total is not None and done < total:
+                raise requests.exceptions.ChunkedEncodingError(f"Connection closed after {done} of {total} bytes")
+            if progress: progress(done, total, (done - offset) / max(time.monotonic() - started, 1e-6))
+            return hasher.hexdigest()
+
+    def _restart(self, url, part_path, progress):
+        os.remove(part_path); self._forget(part_path)
+        return self._download(url, part_path, progress)
+
+download_manager = DownloadManager(DOWNLOAD_CACHE_DIR)
+
+# --- Metrics Store ---
+# One fixed-size memory-mapped file of doubles per server, holding a ring per resolution tier. A sample
+# lands in slot (bucket // step) % slots of every tier, and each slot stores its bucket timestamp, so
+# stale slots are recognised without a head pointer. Raw slots hold (t, cpu, mem); rollup slots hold
+# (t, count, cpu_min, cpu_sum, cpu_max, mem_min, mem_sum, mem_max) and are updated in place.
+METRICS_TIERS = {'raw': (MONITOR_INTERVAL, 1200), '1m': (60, 2880), '1h': (3600, 2160)}
+METRICS_MAGIC = b'PPMETRIC'
+METRICS_HEADER = struct.Struct('<8s6d')
+METRICS_MAX_POINTS = 1500
+
+class MetricsSeries:
+    def __init__(self, path):
+        self.layout, offset = {}, METRICS_HEADER.size // 8
+        for name, (step, slots) in METRICS_TIERS.items():
+            width = 3 if name == 'raw' else 8
+            self.layout[name] = (step, slots, width, offset)
+            offset += slots * width
+        header = METRICS_HEADER.pack(METRICS_MAGIC, *[v for step, slots in METRICS_TIERS.values() for v in (step, slots)])
+        size = offset * 8
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        self.file = open(path, mode)
+        if self.file.read(len(header)) != header or os.fstat(self.file.fileno()).st_size != size:
+            # New file or a different tier layout: start over rather than misread old slots.
+            self.file.seek(0); self.file.truncate(0); self.file.truncate(size)
+            self.file.write(header); self.file.flush()
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.values = memoryview(self.mm).cast('d')
+
+    def record(self, ts, cpu, mem):
+        v = self.values
+        for name, (step, slots, width, offset) in self.layout.items():
+            bucket = float(int(ts // step) * step)
+            base = offset + (int(ts // step) % slots) * width
+            if name == 'raw':
+                v[base + 1], v[base + 2], v[base] = cpu, mem, bucket
+            elif v[base] != bucket:
+                v[base + 1] = 1
+                v[base + 2] = v[base + 3] = v[base + 4] = cpu
+                v[base + 5] = v[base + 6] = v[base + 7] = mem
+                v[base] = bucket
+            else:
+                v[base + 1] += 1
+                v[base + 2], v[base + 3], v[base + 4] = min(v[base + 2], cpu), v[base + 3] + cpu, max(v[base + 4], cpu)
+                v[base + 5], v[base + 6], v[base + 7] = min(v[base + 5], mem), v[base + 6] + mem, max(v[base + 7], mem)
+
+    def query(self, start, end, tier):
+        step, slots, width, offset = self.layout[tier]
+        v, first, last = self.values, max(int(start // step), int(end // step) - slots + 1), int(end // step)
+        out = {'t': [], 'cpu': [], 'mem': []}
+        if tier != 'raw': out.update({'cpu_min': [], 'cpu_max': [], 'mem_min': [], 'mem_max': []})
+        for n in range(first, last + 1):
+            base = offset + (n % slots) * width
+            if v[base] != n * step: continue
+            out['t'].append(int(v[base]))
+            if tier == 'raw':
+                out['cpu'].append(round(v[base + 1], 2)); out['mem'].append(round(v[base + 2], 2))
+            else:
+                count = v[base + 1]
+                out['cpu_min'].append(round(v[base + 2], 2)); out['cpu'].append(round(v[base + 3] / count, 2)); out['cpu_max'].append(round(v[base + 4], 2))
+                out['mem_min'].append(round(v[base + 5], 2)); out['mem'].append(round(v[base + 6] / count, 2)); out['mem_max'].append(round(v[base + 7], 2))
+        return out
+
+    def close(self):
+        self.values.release(); self.mm.close(); self.file.close()
+
+class MetricsStore:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def _path(self, server_id):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_.-]', '_', server_id) + '.bin')
+
+    def _get(self, server_id, create=True):
+        # Callers hold self.lock, so discard can't close a series while it is being read or written.
+        series = self.series.get(server_id)
+        if series is None and (create or os.path.exists(self._path(server_id))):
+            os.makedirs(self.directory, exist_ok=True)
+            series = self.series[server_id] = MetricsSeries(self._path(server_id))
+        return series
+
+    def record(self, server_id, ts, cpu, mem):
+        with self.lock: self._get(server_id).record(ts, cpu, mem)
+
+    def pick_tier(self, start, end, resolution, max_points):
+        if resolution in METRICS_TIERS: return resolution
+        for name, (step, slots) in METRICS_TIERS.items():
+            if (end - start) / step <= max_points and end - start <= step * slots: return name
+        return list(METRICS_TIERS)[-1]
+
+    def query(self, server_id, start, end, tier):
+        with self.lock:
+            series = self._get(server_id, create=False)
+            return series.query(start, end, tier) if series else {'t': [], 'cpu': [], 'mem': []}
+
+    def discard(self, server_id):
+        with self.lock:
+            series = self.series.pop(server_id, None)
+            if series: series.close()
+            try: os.remove(self._path(server_id))
+            except OSError: pass
+
+metrics_store = MetricsStore()
+
+# --- Resource Sampler ---
+# Keeps one psutil.Process handle per process so cpu_percent() can measure the delta since the last
+# sweep without blocking, and sums CPU/RSS over each server's whole process tree (the start command
+# runs through a shell, so the game itself is a child). The parent->children map is rebuilt every
+# SAMPLER_TREE_REFRESH seconds or when a new server shows up; in between only cached handles are read.
+SAMPLER_TREE_REFRESH = 15
+
+class ResourceSampler:
+    def __init__(self):
+        self.handles = {}
+        self.children_map = {}
+        self.tree_refreshed = 0
+        self.last_sweep_ms = 0.0
+
+    def _refresh_tree(self):
+        children = {}
+        for proc in psutil.process_iter(['ppid']):
+            children.setdefault(proc.info['ppid'], []).append(proc.pid)
+        self.children_map, self.tree_refreshed = children, time.monotonic()
+
+    def _descendants(self, pid):
+        stack, found = [pid], []
+        while stack:
+            for child in self.children_map.get(stack.pop(), ()):
+                found.append(child); stack.append(child)
+        return found
+
+    def _sample(self, server_id, pid, refresh_tree):
+        entry = self.handles.get(server_id)
+        if entry is None or entry['root'] != pid:
+            entry = self.handles[server_id] = {'root': pid, 'procs': {pid: psutil.Process(pid)}}
+        if refresh_tree:
+            for child in self._descendants(pid):
+                if child in entry['procs']: continue
+                try: entry['procs'][child] = psutil.Process(child)
+                except psutil.Error: pass
+        cpu, rss = 0.0, 0
+        for proc_pid, proc in list(entry['procs'].items()):
+            try:
+                with proc.oneshot():
+                    cpu += proc.cpu_percent(None); rss += proc.memory_info().rss
+            except psutil.Error:
+                if proc_pid == pid: raise psutil.NoSuchProcess(pid)
+                del entry['procs'][proc_pid]
+        return cpu, rss / (1024*1024)
+
+    def sweep(self, processes):
+        # Returns {server_id: (cpu_percent, rss_mb)}, or None for servers whose process has exited.
+        started = time.perf_counter()
+        refresh_tree = bool(processes.keys() - self.handles.keys()) or time.monotonic() - self.tree_refreshed > SAMPLER_TREE_REFRESH
+        if refresh_tree: self._refresh_tree()
+        for server_id in self.handles.keys() - processes.keys(): del self.handles[server_id]
+        results = {}
+        for server_id, process in processes.items():
+            try:
+                if process.poll() is not None: raise psutil.NoSuchProcess(process.pid)
+                results[server_id] = self._sample(server_id, process.pid, refresh_tree)
+            except psutil.Error:
+                self.handles.pop(server_id, None)
+                results[server_id] = None
+        self.last_sweep_ms = (time.perf_counter() - started) * 1000
+        return results
+
+resource_sampler = ResourceSampler()
+
+# --- CPU Placement ---
+# With 'placement' enabled in settings, each running server's process tree is pinned to its own set of
+# cores and given the nice/IO priority from its config. A server's core count is its weight's share of
+# the usable cores (all cores minus 'placement_reserved' kept for the panel and OS), at least one. Cores
+# are handed out least-loaded first using each server's sustained CPU (an EWMA of the sampler's
+# readings, 100 = one core), preferring the cores a server already has so re-plans move little. The
+# fleet is re-planned when servers start or stop, and every PLACEMENT_REBALANCE seconds if the busiest
+# and idlest cores have drifted more than PLACEMENT_DRIFT apart. Runs on the monitor thread, after the
+# sampler sweep, and reuses the sampler's process handles; children that appear later are pinned on
+# the next tick. Without cpu_affinity (macOS) only priorities are applied.
+PLACEMENT_EWMA = 0.2
+PLACEMENT_REBALANCE = 60
+PLACEMENT_DRIFT = 50.0
+PLACEMENT_LOG = 50
+PLACEMENT_PRIORITIES = ('high', 'normal', 'low', 'idle')
+
+def placement_settings(server_config):
+    placement = server_config.get('placement') or {}
+    try: weight = max(0.1, float(placement.get('weight', 1)))
+    except (TypeError, ValueError): weight = 1.0
+    priority = placement.get('priority') if placement.get('priority') in PLACEMENT_PRIORITIES else 'normal'
+    return {'weight': weight, 'priority': priority}
+
+def priority_values(priority):
+    # Returns (nice, ionice args); ionice args are None where psutil can't set IO priority.
+    if sys.platform == 'win32':
+        nice = {'high': psutil.HIGH_PRIORITY_CLASS, 'normal': psutil.NORMAL_PRIORITY_CLASS, 'low': psutil.BELOW_NORMAL_PRIORITY_CLASS, 'idle': psutil.IDLE_PRIORITY_CLASS}[priority]
+        return nice, ({'high': psutil.IOPRIO_HIGH, 'normal': psutil.IOPRIO_NORMAL, 'low': psutil.IOPRIO_LOW, 'idle': psutil.IOPRIO_VERYLOW}[priority],)
+    nice = {'high': -5, 'normal': 0, 'low': 10, 'idle': 19}[priority]
+    if not hasattr(psutil, 'IOPRIO_CLASS_BE'): return nice, None
+    return nice, {'high': (psutil.IOPRIO_CLASS_BE, 0), 'normal': (psutil.IOPRIO_CLASS_BE, 4), 'low': (psutil.IOPRIO_CLASS_BE, 7), 'idle': (psutil.IOPRIO_CLASS_IDLE, 0)}[priority]
+
+def plan_placement(servers, cores, current):
+    # servers: {id: (weight, load)}. Heaviest first, each onto its least-loaded cores. Returns ({id: cores}, {core: load}).
+    total_weight = sum(weight for weight, _ in servers.values()) or 1
+    core_load, plan = {core: 0.0 for core in cores}, {}
+    for server_id, (weight, load) in sorted(servers.items(), key=lambda item: (-item[1][1], -item[1][0], item[0])):
+        size = max(1, min(len(cores), round(len(cores) * weight / total_weight)))
+        keep = set(current.get(server_id, ()))
+        chosen = sorted(sorted(cores, key=lambda core: (core_load[core], core not in keep, core))[:size])
+        for core in chosen: core_load[core] += load / size
+        plan[server_id] = chosen
+    return plan, core_load
+
+class PlacementEngine:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.servers = {}  # server_id -> {'cores', 'weight', 'priority', 'load', 'reason', 'at', 'error'}
+        self.applied = {}  # pid -> (cores, priority) last applied
+        self.decisions = deque(maxlen=PLACEMENT_LOG)
+        self.last_rebalance = time.monotonic()
+        self.all_cores = list(range(psutil.cpu_count() or 1))
+        self.can_pin = hasattr(psutil.Process, 'cpu_affinity')
+
+    def usable_cores(self):
+        try: reserved = max(0, int(load_config().get('placement_reserved', 0)))
+        except (TypeError, ValueError): reserved = 0
+        return self.all_cores[min(reserved, len(self.all_cores) - 1):]
+
+    def core_load(self, cores):
+        load = {core: 0.0 for core in cores}
+        for placement in self.servers.values():
+            for core in placement['cores']:
+                if core in load: load[core] += placement['load'] / len(placement['cores'])
+        return load
+
+    def update(self, samples):
+        # samples: the sampler's {server_id: (cpu, mem) or None} for this tick.
+        if not load_config().get('placement'):
+            if self.servers or self.applied: self._release()
+            return
+        cores, now, changed = self.usable_cores(), time.monotonic(), []
+        running = {server_id: sample for server_id, sample in samples.items() if sample}
+        with self.lock:
+            replan = bool(self.servers.keys() ^ running.keys())
+            for server_id in list(self.servers):
+                if server_id not in running: del self.servers[server_id]
+            for server_id, (cpu, _) in running.items():
+                settings, placement = placement_settings(get_server_config(server_id) or {}), self.servers.get(server_id)
+                if placement is None:
+                    self.servers[server_id] = dict(settings, cores=[], load=cpu, reason='start', at=None, error=None); continue
+                placement['load'] += PLACEMENT_EWMA * (cpu - placement['load'])
+                if settings['weight'] != placement['weight'] or any(core not in cores for core in placement['cores']): replan = True
+                if settings['priority'] != placement['priority']: placement['priority'] = settings['priority']; changed.append((server_id, 'priority'))
+                placement['weight'] = settings['weight']
+            reason = 'fleet changed' if replan else None
+            if not replan and now - self.last_rebalance >= PLACEMENT_REBALANCE:
+                self.last_rebalance = now
+                load = self.core_load(cores).values()
+                if load and max(load) - min(load) > PLACEMENT_DRIFT: replan, reason = True, 'rebalance'
+            if replan:
+                plan, _ = plan_placement({sid: (p['weight'], p['load']) for sid, p in self.servers.items()}, cores, {sid: p['cores'] for sid, p in self.servers.items()})
+                for server_id, chosen in plan.items():
+                    placement = self.servers[server_id]
+                    if chosen != placement['cores']:
+                        placement.update(cores=chosen, reason='start' if not placement['cores'] else reason)
+                        changed.append((server_id, placement['reason']))
+            for server_id, why in changed:
+                placement = self.servers[server_id]
+                placement['at'] = datetime.now().isoformat(timespec='seconds')
+                self.decisions.append({'at': placement['at'], 'server_id': server_id, 'cores': placement['cores'], 'priority': placement['priority'], 'reason': why, 'load': round(placement['load'], 1)})
+            targets = {server_id: (tuple(p['cores']), p['priority']) for server_id, p in self.servers.items()}
+        live = set()
+        for server_id, target in targets.items():
+            procs = resource_sampler.handles.get(server_id, {}).get('procs', {})
+            live.update(procs)
+            error = self._apply(procs, target)
+            if error != self.servers[server_id]['error']: self.servers[server_id]['error'] = error; changed.append((server_id, 'error'))
+        self.applied = {pid: target for pid, target in self.applied.items() if pid in live}
+        if changed: socketio.emit('placement_update', self.snapshot())
+
+    def _apply(self, procs, target):
+        cores, priority = target
+        nice, ionice, error = *priority_values(priority), None
+        for pid, proc in list(procs.items()):
+            previous = self.applied.get(pid)
+            if previous == target: continue
+            try:
+                if self.can_pin and cores and (not previous or previous[0] != cores): proc.cpu_affinity(list(cores))
+                if not previous or previous[1] != priority:
+                    proc.nice(nice)
+                    if ionice: proc.ionice(*ionice)
+                self.applied[pid] = target
+            except psutil.NoSuchProcess: pass
+            except (psutil.Error, OSError, ValueError) as e:
+                self.applied[pid] = target  # Don't retry every tick; a new target tries again.
+                error = f'{type(e).__name__}: {e}'
+        return error
+
+    def _release(self):
+        # Placement was switched off: give every managed process all cores and normal priority back.
+        with self.lock: server_ids = list(self.servers)
+        for server_id in server_ids:
+            self._apply(resource_sampler.handles.get(server_id, {}).get('procs', {}), (tuple(self.all_cores), 'normal'))
+        with self.lock:
+            self.servers.clear(); self.applied.clear()
+        socketio.emit('placement_update', self.snapshot())
+
+    def snapshot(self):
+        with self.lock:
+            cores = self.usable_cores()
+            return {
+                'enabled': bool(load_config().get('placement')), 'pinning': self.can_pin, 'cores': cores,
+                'core_load': {core: round(load, 1) for core, load in self.core_load(cores).items()},
+                'servers': {server_id: dict(p, load=round(p['load'], 1)) for server_id, p in self.servers.items()},
+                'decisions': list(self.decisions)[::-1]
             }
+
+placement_engine = PlacementEngine()
+
+# --- Fleet Status ---
+# The overview gets one 'fleet_status' per tick holding only servers whose status changed or whose
+# CPU/memory moved past the thresholds below, as {id: [status, cpu, mem]}. Ticks with no changes send
+# nothing; subscribing to 'fleet' returns a full snapshot ('full': True) to that client.
+FLEET_CPU_THRESHOLD = 1.0
+FLEET_MEM_THRESHOLD = 5.0
+fleet_state = {}
+fleet_latest = {}  # Unthresholded rows from the last tick, for /metrics.
+
+def fleet_row_changed(old, new):
+    return old is None or old[0] != new[0] or abs(old[1] - new[1]) >= FLEET_CPU_THRESHOLD or abs(old[2] - new[2]) >= FLEET_MEM_THRESHOLD
+
+def publish_fleet_status(fleet):
+    global fleet_state
+    changed = {server_id: row for server_id, row in fleet.items() if fleet_row_changed(fleet_state.get(server_id), row)}
+    removed = [server_id for server_id in fleet_state if server_id not in fleet]
+    if not changed and not removed: return
+    state = {server_id: row for server_id, row in fleet_state.items() if server_id in fleet}
+    state.update(changed)
+    fleet_state = state
+    socketio.emit('fleet_status', {'servers': changed, 'removed': removed, 'full': False, 'sweep_ms': round(resource_sampler.last_sweep_ms, 3)}, to=subscription_room('fleet'))
+
+def room_has_members(room):
+    return next(socketio.server.manager.get_participants('/', room), None) is not None
+
+def monitor_tick():
+    global fleet_latest
+    started = time.perf_counter()
+    all_ids = [s['id'] for s in servers_store.get()]
+    known = set(all_ids)
+    now = time.time()
+    fleet = {}
+    # A server deleted while its process still runs is no longer sampled or recorded.
+    samples = resource_sampler.sweep({server_id: data['process'] for server_id, data in list(server_processes.items()) if server_id in known})
+    panel_metrics.observe('pulse_sampler_sweep_seconds', (), resource_sampler.last_sweep_ms / 1000)
+    try: placement_engine.update(samples)
+    except Exception as e: print(f"PLACEMENT: update failed: {e}")
+    # Exits are noticed by the lifecycle manager; the status here is its state.
+    for server_id, sample in samples.items():
+        cpu, mem = sample or (0, 0)
+        fleet[server_id] = [lifecycle.state(server_id), round(cpu, 2), round(mem, 2)]
+    for server_id in all_ids:
+        if server_id not in fleet: fleet[server_id] = [lifecycle.state(server_id), 0, 0]
+    for server_id, (status, cpu, mem) in fleet.items():
+        metrics_store.record(server_id, now, cpu, mem)
+        room = subscription_room('performance', server_id)
+        if room_has_members(room): socketio.emit('performance_update', {'id': server_id, 'cpu': cpu, 'mem': mem}, to=room)
+    publish_fleet_status(fleet)
+    fleet_latest = fleet
+    panel_metrics.observe('pulse_monitor_tick_seconds', (), time.perf_counter() - started)
+
+def monitor_servers():
+    # A failing tick is logged and the next one runs as usual; the thread must never die.
     while True:
-        all_ids = [s['id'] for s in load_json_file(SERVERS_FILE)]
-        for server_id in all_ids:
-             if server_id not in performance_data:
-                performance_data[server_id] = {
-                    "cpu": deque([0] * MAX_PERF_DATA_POINTS, maxlen=MAX_PERF_DATA_POINTS),
-                    "mem": deque([0] * MAX_PERF_DATA_POINTS, maxlen=MAX_PERF_DATA_POINTS)
-                }
-        for server_id, data in list(server_processes.items()):
-            try:
-                process, p = data['process'], psutil.Process(data['process'].pid)
-                if process.poll() is None and p.is_running():
-                    cpu = p.cpu_percent(interval=0.1)
-                    mem = p.memory_info().rss / (1024*1024)
-                    status = 'online'
-                    performance_data[server_id]['cpu'].append(round(cpu, 2))
-                    performance_data[server_id]['mem'].append(round(mem, 2))
-                else: raise psutil.NoSuchProcess(process.pid)
-            except psutil.NoSuchProcess:
-                status, cpu, mem = 'offline', 0, 0
-                if server_id in server_processes: del server_processes[server_id]
-                socketio.emit('console_output', {'id': server_id, 'data': '\n--- Server Stopped Unexpectedly ---\n'})
-                performance_data[server_id]['cpu'].append(0)
-                performance_data[server_id]['mem'].append(0)
-            socketio.emit('status_update', {'id': server_id, 'status': status, 'cpu': f"{cpu:.2f}", 'mem': f"{mem:.2f}"})
-            socketio.emit('performance_update', {'id': server_id, 'cpu': round(cpu, 2), 'mem': round(mem, 2)})
-        running_ids = list(server_processes.keys())
-        for server_id in all_ids:
-            if server_id not in running_ids:
-                socketio.emit('status_update', {'id': server_id, 'status': 'offline', 'cpu': '0.00', 'mem': '0.00'})
-                if server_id in performance_data:
-                    performance_data[server_id]['cpu'].append(0)
-                    performance_data[server_id]['mem'].append(0)
-                    socketio.emit('performance_update', {'id': server_id, 'cpu': 0, 'mem': 0})
-        socketio.sleep(3)
+        try: monitor_tick()
+        except Exception as e: print(f"MONITOR: tick failed: {e}")
+        socketio.sleep(MONITOR_INTERVAL)
+
+# --- Scheduler ---
+# The schedule library only decides when a task is due; the scheduler thread never runs one itself. A due
+# task is delayed by a stable per-server offset within schedule_jitter seconds, so one at_time set across a
+# fleet is spread out instead of firing at once, then queued per action. Each action type has its own
+# concurrency limit (schedule_limits overrides SCHEDULE_ACTION_LIMITS); a task is only handed to
+# schedule_executor while its action has a free slot, and a finishing task starts the next one of its
+# action, so a burst of one action never holds workers that another action could use. A task that is
+# still pending or running when it comes due again is skipped, and every run is recorded in the history.
+SCHEDULE_MAX_WORKERS = 16
+SCHEDULE_DEFAULT_JITTER = 120
+SCHEDULE_ACTION_LIMITS = {'restart': 4, 'update': 2, 'backup': 2}
+SCHEDULE_HISTORY_LIMIT = 500
+
+schedule_executor = ThreadPoolExecutor(max_workers=SCHEDULE_MAX_WORKERS, thread_name_prefix='schedule')
+scheduled_jobs = {}  # task key -> schedule.Job
+schedule_pending = []  # heap of (due monotonic time, seq, server_id, action, due_at)
+schedule_ready = {}  # action -> deque of (server_id, due_at) past their offset, waiting for a slot
+schedule_active = set()  # (server_id, action) pending or running
+schedule_running = {}  # action -> running count
+schedule_lock = threading.Lock()
+schedule_seq = itertools.count()
+
+def schedule_jitter():
+    try: return max(0, int(load_config().get('schedule_jitter', SCHEDULE_DEFAULT_JITTER)))
+    except (TypeError, ValueError): return SCHEDULE_DEFAULT_JITTER
+
+def schedule_limit(action):
+    limits = load_config().get('schedule_limits') or {}
+    try: return max(1, int(limits.get(action, SCHEDULE_ACTION_LIMITS.get(action, 1))))
+    except (TypeError, ValueError, AttributeError): return SCHEDULE_ACTION_LIMITS.get(action, 1)
+
+def schedule_offset(server_id, action):
+    # Stable across restarts, so a server keeps its slot in the fleet-wide spread.
+    jitter = schedule_jitter()
+    return zlib.crc32(f'{server_id}:{action}'.encode()) % (jitter + 1) if jitter else 0
+
+def dispatch_scheduled_task(server_id, action):
+    with schedule_lock:
+        if (server_id, action) in schedule_active:
+            record_schedule_run(server_id, action, datetime.now(), None, 'skipped', 'Previous run has not finished yet.'); return
+        schedule_active.add((server_id, action))
+        heapq.heappush(schedule_pending, (time.monotonic() + schedule_offset(server_id, action), next(schedule_seq), server_id, action, datetime.now()))
 
 def scheduler_thread():
     while True:
         schedule.run_pending()
+        now = time.monotonic()
+        with schedule_lock:
+            while schedule_pending and schedule_pending[0][0] <= now:
+                _, _, server_id, action, due_at = heapq.heappop(schedule_pending)
+                schedule_ready.setdefault(action, deque()).append((server_id, due_at))
+            start_ready_tasks()
         time.sleep(1)
 
+def start_ready_tasks(actions=None):
+    # Called with schedule_lock held. Submits queued tasks of each action up to its limit.
+    for action in actions or list(schedule_ready):
+        queue, limit = schedule_ready.get(action), schedule_limit(action)
+        while queue and schedule_running.get(action, 0) < limit:
+            server_id, due_at = queue.popleft()
+            schedule_running[action] = schedule_running.get(action, 0) + 1
+            schedule_executor.submit(execute_scheduled_task, server_id, action, due_at)
+        if not queue: schedule_ready.pop(action, None)
+
+def execute_scheduled_task(server_id, action, due_at):
+    started = datetime.now()
+    try: result, detail = run_scheduled_task(server_id, action)
+    except Exception as e: result, detail = 'failed', str(e)
+    try: record_schedule_run(server_id, action, due_at, started, result, detail)
+    finally:
+        with schedule_lock:
+            schedule_running[action] -= 1
+            schedule_active.discard((server_id, action))
+            start_ready_tasks((action,))
+
+def record_schedule_run(server_id, action, due_at, started, result, detail):
+    finished = datetime.now()
+    entry = {
+        'server_id': server_id, 'action': action, 'due_at': due_at.isoformat(timespec='seconds'),
+        'started_at': started.isoformat(timespec='seconds') if started else None, 'finished_at': finished.isoformat(timespec='seconds'),
+        'duration': round((finished - started).total_seconds(), 1) if started else 0, 'result': result, 'detail': detail
+    }
+    def apply(history):
+        history.append(entry)
+        del history[:max(0, len(history) - SCHEDULE_HISTORY_LIMIT)]
+    schedule_history_store.update(apply)
+    panel_metrics.inc('pulse_scheduled_runs_total', (('action', action), ('result', result)))
+    if started: panel_metrics.observe('pulse_scheduled_run_seconds', (('action', action),), entry['duration'])
+    print(f"SCHEDULER: '{action}' for server '{server_id}' {result}: {detail}")
+    socketio.emit('schedule_run', entry)
+
 def run_scheduled_task(server_id, action):
+    # Returns (result, detail); runs on a schedule_executor worker, so it may block until the action is done.
     print(f"SCHEDULER: Running '{action}' for server '{server_id}'")
+    config = get_server_config(server_id)
+    if not config: return 'failed', 'Server not found.'
     if action == 'restart':
-        config = get_server_config(server_id)
-        if config and server_id in server_processes:
-            _stop_server_process(server_id)
-            time.sleep(5)
-            _start_server_process(server_id, config)
+        if lifecycle.state(server_id) not in ('starting', 'ready'): return 'skipped', 'Server is not running.'
+        settings = lifecycle_settings(config)
+        lifecycle.restart(server_id)
+        if not lifecycle.wait(server_id, ('ready', 'crashed'), settings['stop_timeout'] + LIFECYCLE_KILL_TIMEOUT + settings['ready_timeout']):
+            return 'failed', 'Server was not ready in time.'
+        return ('ok', 'Server restarted and ready.') if lifecycle.state(server_id) == 'ready' else ('failed', 'Server did not start.')
     elif action == 'update':
-        handle_update_server({'id': server_id})
+        job = handle_update_server({'id': server_id})
+        if not job: return 'failed', 'Update could not be queued.'
+        steam_jobs.wait(job)
+        return ('ok', 'Update finished.') if job['status'] == 'done' else ('failed', job['error'] or 'Update failed.')
     elif action == 'backup':
-        handle_create_backup({'id': server_id, 'is_scheduled': True})
+        if server_backup_lock(server_id).locked(): return 'skipped', 'Another backup/restore of this server is running.'
+        filename = _create_backup_task(server_id, is_scheduled=True)
+        return ('ok', f'Created {filename}.') if filename else ('failed', 'Backup failed.')
+    return 'failed', f"Unknown action '{action}'."
 
-def load_schedules():
-    schedule.clear()
-    schedules = load_json_file(SCHEDULES_FILE, is_dict=True)
+def schedule_task_keys(schedules):
+    # Identical tasks on one server get distinct keys, so each is scheduled.
+    keys = {}
     for server_id, tasks in schedules.items():
         for task in tasks:
+            base = f"{server_id}|{task.get('action')}|{task.get('interval')}|{task.get('unit')}|{task.get('at_time') or ''}"
+            n = 0
+            while f'{base}#{n}' in keys: n += 1
+            keys[f'{base}#{n}'] = (server_id, task)
+    return keys
+
+def load_schedules():
+    # Only tasks that were added or removed since the last call are touched; the others keep their next run.
+    wanted = schedule_task_keys(schedules_store.get())
+    for key in [key for key in scheduled_jobs if key not in wanted]:
+        schedule.cancel_job(scheduled_jobs.pop(key))
+    for key, (server_id, task) in wanted.items():
+        if key in scheduled_jobs: continue
+        try:
             job = schedule.every(int(task['interval']))
             if task['unit'] == 'hours': job = job.hours
             elif task['unit'] == 'days': job = job.days
             if task.get('at_time'): job = job.at(task['at_time'])
-            job.do(run_scheduled_task, server_id=server_id, action=task['action'])
-    print("Schedules loaded and configured.")
+            scheduled_jobs[key] = job.do(dispatch_scheduled_task, server_id=server_id, action=task['action']).tag(server_id)
+        except (KeyError, TypeError, ValueError, schedule.ScheduleValueError) as e:
+            print(f"SCHEDULER: Ignoring invalid task for '{server_id}': {task} ({e})")
+    print(f"Schedules loaded and configured ({len(scheduled_jobs)} tasks).")
+
+# --- Backup Engine ---
+# Backups are content-addressed. Files are split into BACKUP_CHUNK_SIZE chunks stored once, compressed,
+# under backups/chunks/<aa>/<sha256>, and each backup is a small JSON manifest listing every file's size,
+# mtime and chunk hashes. Files whose size and mtime match the previous manifest reuse its chunk list
+# without being read. The backups/ folder itself is never part of a backup. Legacy .zip backups are
+# still listed, restored and downloaded as before.
+BACKUP_DIR_NAME = 'backups'
+BACKUP_CHUNK_SIZE = 4 * 1024 * 1024
+BACKUP_MANIFEST_VERSION = 1
+
+# --- Backup Workers & Codecs ---
+# Backup and restore jobs run on a small worker pool with one lock per server, so different servers
+# back up in parallel while a second job for the same server is refused. BACKUP_IO_LIMIT caps how many
+# jobs walk/read/write server trees at once. Chunk hashing and compression run on a shared pool
+# (hashlib and the codecs release the GIL) with at most BACKUP_INFLIGHT_CHUNKS chunks buffered per job.
+# Each stored chunk starts with a one-byte codec tag; codec and level come from config.json.
+BACKUP_MAX_JOBS = 4
+BACKUP_IO_LIMIT = 2
+BACKUP_INFLIGHT_CHUNKS = 16
+BACKUP_PROGRESS_INTERVAL = 0.5
+BACKUP_CODECS = {
+    'none': (b'N', range(0, 1), lambda data, level: data, lambda data: data),
+    'zlib': (b'Z', range(0, 10), lambda data, level: zlib.compress(data, level), zlib.decompress),
+    'lzma': (b'X', range(0, 10), lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+}
+if zstandard:
+    BACKUP_CODECS['zstd'] = (b'S', range(1, 23), lambda data, level: zstandard.ZstdCompressor(level=level).compress(data), lambda data: zstandard.ZstdDecompressor().decompress(data))
+BACKUP_CODEC_TAGS = {tag[0]: decompress for tag, levels, compress, decompress in BACKUP_CODECS.values()}
+
+backup_executor = ThreadPoolExecutor(max_workers=BACKUP_MAX_JOBS, thread_name_prefix='backup')
+chunk_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix='chunk')
+backup_io_slots = threading.BoundedSemaphore(BACKUP_IO_LIMIT)
+backup_locks = {}
+backup_locks_guard = threading.Lock()
+
+def server_backup_lock(server_id):
+    with backup_locks_guard:
+        return backup_locks.setdefault(server_id, threading.Lock())
+
+def backup_codec_settings():
+    config = load_config()
+    codec = config.get('backup_codec', 'zlib')
+    if codec not in BACKUP_CODECS: codec = 'zlib'
+    levels = BACKUP_CODECS[codec][1]
+    try: level = int(config.get('backup_level', 1))
+    except (TypeError, ValueError): level = 1
+    return codec, min(max(level, levels.start), levels.stop - 1)
+
+class BackupProgress:
+    def __init__(self, server_id, job, bytes_total, files_total):
+        self.server_id, self.job, self.bytes_total, self.files_total = server_id, job, bytes_total, files_total
+        self.bytes_done = self.files_done = 0
+        self.started = self.last_emit = time.monotonic()
+        self.lock = threading.Lock()
+
+    def advance(self, nbytes=0, files=0):
+        with self.lock:
+            self.bytes_done += nbytes; self.files_done += files
+            if time.monotonic() - self.last_emit < BACKUP_PROGRESS_INTERVAL: return
+            self.last_emit = time.monotonic()
+        self.emit()
+
+    def emit(self, done=False):
+        self.last_emit = time.monotonic()
+        elapsed = max(self.last_emit - self.started, 1e-6)
+        rate = self.bytes_done / elapsed
+        eta = (self.bytes_total - self.bytes_done) / rate if rate > 0 else None
+        socketio.emit('backup_progress', {
+            'id': self.server_id, 'job': self.job, 'done': done,
+            'bytes_done': self.bytes_done, 'bytes_total': self.bytes_total,
+            'files_done': self.files_done, 'files_total': self.files_total,
+            'rate': round(rate), 'eta': round(eta, 1) if eta is not None and not done else None
+        })
+
+class ChunkStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, digest, data, codec='zlib', level=1):
+        # Returns the number of bytes newly written (0 if the chunk was already stored).
+        path = self.path(digest)
+        if os.path.exists(path): return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tag, levels, compress, decompress = BACKUP_CODECS[codec]
+        packed = compress(data, level)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f: f.write(tag); f.write(packed)
+        os.replace(tmp_path, path)
+        return len(packed) + 1
+
+    def get(self, digest):
+        with open(self.path(digest), 'rb') as f: packed = f.read()
+        if not packed or packed[0] not in BACKUP_CODEC_TAGS: raise ValueError(f"Chunk {digest} is corrupt (unknown codec tag).")
+        return BACKUP_CODEC_TAGS[packed[0]](memoryview(packed)[1:])
+
+    def collect_garbage(self, referenced):
+        removed = 0
+        if not os.path.isdir(self.root): return removed
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir(): continue
+            for entry in os.scandir(prefix.path):
+                if entry.name not in referenced:
+                    os.remove(entry.path); removed += 1
+        return removed
+
+def backup_store(server_dir):
+    backups_dir = os.path.join(server_dir, BACKUP_DIR_NAME)
+    return backups_dir, ChunkStore(os.path.join(backups_dir, 'chunks'))
+
+def resolve_inside(base_dir, relative_path):
+    base_dir = os.path.abspath(base_dir)
+    full_path = os.path.abspath(os.path.join(base_dir, relative_path))
+    return full_path if full_path.startswith(base_dir + os.sep) else None
+
+def scan_tree(root, skip_top=(BACKUP_DIR_NAME,)):
+    # One scandir pass; returns ([(relative posix path, stat)], [relative dirs]).
+    files, dirs, stack = [], [], ['']
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                if not rel_dir and entry.name in skip_top: continue
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False): dirs.append(rel); stack.append(rel)
+                elif entry.is_file(): files.append((rel, entry.stat()))
+    return files, dirs
+
+def list_manifests(backups_dir):
+    if not os.path.isdir(backups_dir): return []
+    return sorted(name for name in os.listdir(backups_dir) if name.startswith('backup_') and name.endswith('.json'))
+
+def load_manifest(backups_dir, name):
+    with open(os.path.join(backups_dir, name), 'r', encoding='utf-8') as f: return json.load(f)
+
+def is_under(rel, prefixes):
+    return any(not prefix or rel == prefix or rel.startswith(prefix + '/') for prefix in prefixes)
+
+def create_incremental_backup(server_dir, server_id=None, codec='zlib', level=1, staging_dir=None, staged_paths=()):
+    # With staging_dir set, files under staged_paths (all files if it is empty) are read from the
+    # hot-snapshot staging tree instead of the live server directory.
+    backups_dir, store = backup_store(server_dir)
+    os.makedirs(backups_dir, exist_ok=True)
+    names = list_manifests(backups_dir)
+    previous = {entry['path']: entry for entry in load_manifest(backups_dir, names[-1])['files']} if names else {}
+    files, dirs = scan_tree(server_dir)
+    sources = {}
+    if staging_dir:
+        prefixes = list(staged_paths) or ['']
+        staged_files, staged_dirs = scan_tree(staging_dir, skip_top=())
+        files = [(rel, st) for rel, st in files if not is_under(rel, prefixes)] + staged_files
+        dirs = sorted(set(dirs) | set(staged_dirs))
+        sources = {rel: staging_dir for rel, st in staged_files}
+    entries, changed, reused = [], [], 0
+    for rel, st in files:
+        old = previous.get(rel)
+        if old and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+            entries.append(old); reused += 1
+        else:
+            entry = {'path': rel, 'size': 0, 'mtime_ns': st.st_mtime_ns, 'chunks': []}
+            entries.append(entry); changed.append((entry, st.st_size))
+    progress = BackupProgress(server_id, 'backup', sum(size for entry, size in changed), len(changed))
+    stored_size, pending = 0, deque()
+
+    def store_chunk(data):
+        digest = hashlib.sha256(data).hexdigest()
+        return digest, store.put(digest, data, codec, level)
+
+    def settle(limit):
+        # Futures resolve in submission order, so each file's chunk list stays in order.
+        nonlocal stored_size
+        while len(pending) > limit:
+            entry, future, size = pending.popleft()
+            digest, stored = future.result()
+            entry['chunks'].append(digest); stored_size += stored
+            progress.advance(size)
+
+    vanished = set()
+    for entry, expected_size in changed:
+        try: f = open(os.path.join(sources.get(entry['path'], server_dir), entry['path']), 'rb')
+        except FileNotFoundError:
+            # Deleted since the scan (temp and lock files of a live server); left out of the manifest.
+            vanished.add(entry['path']); progress.advance(expected_size, files=1); continue
+        with f:
+            while True:
+                data = f.read(BACKUP_CHUNK_SIZE)
+                if not data: break
+                entry['size'] += len(data)
+                pending.append((entry, chunk_executor.submit(store_chunk, data), len(data)))
+                settle(BACKUP_INFLIGHT_CHUNKS)
+        progress.advance(files=1)
+    settle(0)
+    progress.emit(done=True)
+    if vanished: entries = [entry for entry in entries if entry['path'] not in vanished]
+    total_size = sum(entry['size'] for entry in entries)
+    created = datetime.now()
+    manifest = {
+        'version': BACKUP_MANIFEST_VERSION, 'created_at': created.strftime('%Y-%m-%d %H:%M:%S'),
+        'total_size': total_size, 'stored_size': stored_size, 'reused_files': reused, 'codec': codec, 'level': level,
+        'dirs': dirs, 'files': entries
+    }
+    # Names carry microseconds and are created exclusively, so two backups in the same second (say a
+    # scheduled and a manual one) each get their own manifest; '_<n>' sorts after the plain name.
+    data, stem = json.dumps(manifest), f"backup_{created.strftime('%Y-%m-%d_%H-%M-%S_%f')}"
+    for attempt in itertools.count():
+        name = f"{stem}_{attempt}.json" if attempt else f"{stem}.json"
+        try: f = open(os.path.join(backups_dir, name), 'x', encoding='utf-8')
+        except FileExistsError: continue
+        with f: f.write(data); f.flush(); os.fsync(f.fileno())
+        return name, manifest
+
+# --- Hot Snapshots ---
+# Running servers are backed up from a snapshot: the server's save command (if configured) is sent
+# through stdin, and after a short flush wait the save paths are cloned into a staging tree under
+# backups/. Cloning uses a reflink (copy-on-write, Linux FICLONE) where the filesystem supports it,
+# else a hardlink (safe for games that save by writing a new file and renaming it), else a copy.
+# Only the cloning has to happen while the server is quiet; compression then runs off the staging copy.
+SNAPSHOT_SAVE_WAIT = 3
+SNAPSHOT_STAGING_PREFIX = '.staging-'
+FICLONE = 0x40049409
+
+def snapshot_settings(server_config):
+    snapshot = server_config.get('snapshot') or {}
+    paths = [p.strip().replace('\\', '/').strip('/') for p in snapshot.get('save_paths') or [] if p.strip()]
+    try: wait = max(0.0, float(snapshot.get('save_wait', SNAPSHOT_SAVE_WAIT)))
+    except (TypeError, ValueError): wait = SNAPSHOT_SAVE_WAIT
+    return {'save_command': snapshot.get('save_command') or '', 'save_paths': paths, 'save_wait': wait}
+
+def clone_file(src, dst, method):
+    # Returns the method that worked, so the next file starts there instead of retrying the ones that failed.
+    if method == 'reflink':
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d: fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            shutil.copystat(src, dst)
+            return method
+        except OSError:
+            try: os.remove(dst)
+            except OSError: pass
+            method = 'hardlink'
+    if method == 'hardlink':
+        try:
+            os.link(src, dst)
+            return method
+        except OSError: method = 'copy'
+    shutil.copy2(src, dst)
+    return method
+
+def stage_snapshot(server_dir, save_paths, staging_dir):
+    method, count = 'reflink' if fcntl else 'hardlink', 0
+    for rel_root in save_paths or ['']:
+        src_root = resolve_inside(server_dir, rel_root) if rel_root else os.path.abspath(server_dir)
+        if not src_root or not os.path.exists(src_root): continue
+        dst_root = os.path.join(staging_dir, rel_root)
+        if os.path.isfile(src_root):
+            os.makedirs(os.path.dirname(dst_root), exist_ok=True)
+            method = clone_file(src_root, dst_root, method); count += 1
+            continue
+        files, dirs = scan_tree(src_root, skip_top=() if rel_root else (BACKUP_DIR_NAME,))
+        os.makedirs(dst_root, exist_ok=True)
+        for rel in dirs: os.makedirs(os.path.join(dst_root, rel), exist_ok=True)
+        for rel, st in files:
+            method = clone_file(os.path.join(src_root, rel), os.path.join(dst_root, rel), method); count += 1
+    return count, method
+
+def create_hot_backup(server_id, server_config, codec, level):
+    server_dir, snapshot = server_config['cwd'], snapshot_settings(server_config)
+    backups_dir = os.path.join(server_dir, BACKUP_DIR_NAME)
+    os.makedirs(backups_dir, exist_ok=True)
+    for name in os.listdir(backups_dir):
+        if name.startswith(SNAPSHOT_STAGING_PREFIX): shutil.rmtree(os.path.join(backups_dir, name), ignore_errors=True)
+    if snapshot['save_command'] and write_server_stdin(server_id, snapshot['save_command']):
+        time.sleep(snapshot['save_wait'])
+    staging_dir = os.path.join(backups_dir, f"{SNAPSHOT_STAGING_PREFIX}{int(time.time() * 1000)}")
+    try:
+        started = time.perf_counter()
+        count, method = stage_snapshot(server_dir, snapshot['save_paths'], staging_dir)
+        emit_console(server_id, f"--- Backup snapshot: {count} files via {method} in {(time.perf_counter() - started) * 1000:.0f} ms ---\n")
+        return create_incremental_backup(server_dir, server_id, codec, level, staging_dir, snapshot['save_paths'])
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+# --- Restore Engine ---
+# Restores are differential: each file in the backup is compared with what is on disk (size and mtime
+# first, then content hash when only the mtime differs) and only files that differ are written, on a
+# pool of workers. Every chunk is verified against its digest before a file is swapped into place.
+# 'paths' limits the restore to a subset of the tree (e.g. just the save folder); 'prune' removes files
+# under those paths that did not exist when the backup was taken.
+RESTORE_WORKERS = 4
+
+def normalize_restore_paths(paths):
+    if isinstance(paths, str): paths = paths.split(',')
+    return [p.strip().replace('\\', '/').strip('/') for p in paths or [] if p and p.strip()]
+
+def file_matches_chunks(path, chunks):
+    with open(path, 'rb') as f:
+        for digest in chunks:
+            if hashlib.sha256(f.read(BACKUP_CHUNK_SIZE)).hexdigest() != digest: return False
+        return not f.read(1)
+
+def file_matches_crc(path, crc):
+    value = 0
+    with open(path, 'rb') as f:
+        while data := f.read(BACKUP_CHUNK_SIZE): value = zlib.crc32(data, value)
+    return value == crc
+
+def plan_restore(server_dir, entries, paths, prune, unchanged):
+    # entries: {rel: (size, entry)}. Returns (to_write, to_touch, extras): files to rewrite, files whose
+    # content matches but mtime does not, and files on disk that the backup does not contain.
+    current = dict(scan_tree(server_dir)[0])
+    to_write, to_touch = [], []
+    for rel, (size, entry) in entries.items():
+        st = current.get(rel)
+        state = False if st is None or st.st_size != size else unchanged(rel, st, entry)
+        if state is False: to_write.append(rel)
+        elif state is None: to_touch.append(rel)
+    extras = [rel for rel in current if rel not in entries and is_under(rel, paths or [''])] if prune else []
+    return to_write, to_touch, extras
+
+def prune_extras(server_dir, extras, keep_dirs):
+    for rel in extras:
+        path = resolve_inside(server_dir, rel)
+        if path: os.remove(path)
+    # Remove directories left empty by the prune, deepest first, never above the server directory.
+    emptied = set()
+    for rel in extras:
+        rel = os.path.dirname(rel)
+        while rel and rel not in keep_dirs: emptied.add(rel); rel = os.path.dirname(rel)
+    for rel in sorted(emptied, key=len, reverse=True):
+        path = resolve_inside(server_dir, rel)
+        try: os.rmdir(path)
+        except OSError: pass
+
+def run_restore(server_dir, entries, dirs, paths, prune, unchanged, write_file, progress):
+    to_write, to_touch, extras = plan_restore(server_dir, entries, paths, prune, unchanged)
+    progress.bytes_total = sum(entries[rel][0] for rel in to_write)
+    progress.advance(files=len(entries) - len(to_write))
+    for rel in dirs:
+        path = resolve_inside(server_dir, rel)
+        if path: os.makedirs(path, exist_ok=True)
+    for rel in to_touch:
+        entry = entries[rel][1]
+        if 'mtime_ns' in entry: os.utime(resolve_inside(server_dir, rel), ns=(entry['mtime_ns'], entry['mtime_ns']))
+
+    def restore_one(rel):
+        path = resolve_inside(server_dir, rel)
+        if not path: return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.pprestore"
+        try:
+            with open(tmp_path, 'wb') as f: write_file(rel, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            raise
+        entry = entries[rel][1]
+        if 'mtime_ns' in entry: os.utime(path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        progress.advance(files=1)
+
+    with ThreadPoolExecutor(max_workers=RESTORE_WORKERS, thread_name_prefix='restore') as pool:
+        for future in [pool.submit(restore_one, rel) for rel in to_write]: future.result()
+    if extras: prune_extras(server_dir, extras, set(dirs))
+    progress.emit(done=True)
+    return {'written': len(to_write), 'unchanged': len(entries) - len(to_write), 'pruned': len(extras)}
+
+def restore_manifest(server_dir, manifest, store, server_id=None, paths=None, prune=False):
+    paths = normalize_restore_paths(paths)
+    selected = [entry for entry in manifest['files'] if not paths or is_under(entry['path'], paths)]
+    entries = {entry['path']: (entry['size'], entry) for entry in selected}
+    dirs = [rel for rel in manifest['dirs'] if not paths or is_under(rel, paths)]
+    progress = BackupProgress(server_id, 'restore', 0, len(entries))
+
+    def unchanged(rel, st, entry):
+        # True: identical. None: same content, only the mtime differs. False: must be rewritten.
+        if st.st_mtime_ns == entry['mtime_ns']: return True
+        return None if file_matches_chunks(os.path.join(server_dir, rel), entry['chunks']) else False
+
+    def write_file(rel, f):
+        for digest in entries[rel][1]['chunks']:
+            data = store.get(digest)
+            if hashlib.sha256(data).hexdigest() != digest: raise ValueError(f"Backup chunk {digest[:12]} of '{rel}' is corrupt.")
+            f.write(data); progress.advance(len(data))
+
+    return run_restore(server_dir, entries, dirs, paths, prune, unchanged, write_file, progress)
+
+def restore_zip(server_dir, zip_path, server_id=None, paths=None, prune=False):
+    # Legacy zip backups carry no mtimes we trust, so they are compared by size and CRC-32; each worker
+    # opens its own handle since a ZipFile cannot be shared between threads. zipfile checks the CRC on read.
+    paths = normalize_restore_paths(paths)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref: infos = zip_ref.infolist()
+    # Zips made before the chunk store included backups/ itself (possibly the archive being read); that is never restored.
+    members = [info for info in infos if not is_under(info.filename.rstrip('/'), [BACKUP_DIR_NAME])
+               and (not paths or is_under(info.filename.rstrip('/'), paths))]
+    entries = {info.filename: (info.file_size, {'crc': info.CRC}) for info in members if not info.is_dir()}
+    dirs = [info.filename.rstrip('/') for info in members if info.is_dir()]
+    dirs += sorted({os.path.dirname(rel) for rel in entries} - {''} - set(dirs))
+    progress = BackupProgress(server_id, 'restore', 0, len(entries))
+    local, handles = threading.local(), []
+
+    def unchanged(rel, st, entry):
+        return True if file_matches_crc(os.path.join(server_dir, rel), entry['crc']) else False
+
+    def write_file(rel, f):
+        if not hasattr(local, 'zip'):
+            local.zip = zipfile.ZipFile(zip_path, 'r'); handles.append(local.zip)
+        with local.zip.open(rel) as src:
+            while data := src.read(BACKUP_CHUNK_SIZE):
+                f.write(data); progress.advance(len(data))
+
+    try: return run_restore(server_dir, entries, dirs, paths, prune, unchanged, write_file, progress)
+    finally:
+        for handle in handles: handle.close()
+
+def collect_backup_garbage(server_dir):
+    backups_dir, store = backup_store(server_dir)
+    referenced = set()
+    for name in list_manifests(backups_dir):
+        for entry in load_manifest(backups_dir, name)['files']: referenced.update(entry['chunks'])
+    return store.collect_garbage(referenced)
+
+backup_summary_cache = {}
+
+def manifest_summary(backups_dir, name):
+    path = os.path.join(backups_dir, name)
+    mtime = os.stat(path).st_mtime_ns
+    cached = backup_summary_cache.get(path)
+    if cached and cached[0] == mtime: return cached[1]
+    manifest = load_manifest(backups_dir, name)
+    summary = {
+        'filename': name, 'type': 'incremental', 'created_at': manifest['created_at'], 'files': len(manifest['files']),
+        'size_mb': round(manifest['total_size'] / (1024 * 1024), 2), 'stored_mb': round(manifest['stored_size'] / (1024 * 1024), 2)
+    }
+    backup_summary_cache[path] = (mtime, summary)
+    return summary
+
+class _ZipStream(io.RawIOBase):
+    # Unseekable sink for zipfile; export_backup_zip drains it after every write.
+    def __init__(self): self.buffer = bytearray()
+    def writable(self): return True
+    def write(self, data): self.buffer += data; return len(data)
+    def drain(self):
+        data = bytes(self.buffer); self.buffer.clear(); return data
+
+def export_backup_zip(server_dir, name):
+    backups_dir, store = backup_store(server_dir)
+    manifest = load_manifest(backups_dir, name)
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+        for rel in manifest['dirs']:
+            z.writestr(zipfile.ZipInfo(rel + '/'), b'')
+        for entry in manifest['files']:
+            info = zipfile.ZipInfo(entry['path'], date_time=time.localtime(entry['mtime_ns'] / 1e9)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with z.open(info, 'w', force_zip64=entry['size'] > 2**31) as dest:
+                for digest in entry['chunks']:
+                    dest.write(store.get(digest))
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+# --- File Browser Cache ---
+# Directory listings come from a single scandir pass (type, size and mtime per entry) and are cached per
+# directory, sorted lazily per sort key, and paged out with cursors. On Linux an inotify watch on each
+# cached directory drops its entry on any change; elsewhere a cached listing is reused while the
+# directory's mtime is unchanged and it is younger than FS_CACHE_TTL (the directory mtime does not
+# change when a file inside it grows, so sizes may lag by up to the TTL).
+FS_CACHE_MAX_DIRS = 256
+FS_CACHE_TTL = 5
+FS_PAGE_SIZE = 500
+FS_MAX_PAGE_SIZE = 2000
+FS_SORT_KEYS = {
+    'name': lambda item: item['name'].lower(),
+    'size': lambda item: (item['size'], item['name'].lower()),
+    'mtime': lambda item: (item['mtime'], item['name'].lower()),
+}
+IN_WATCH_MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800  # modify, attrib, close_write, moves, create, delete, *_self
+IN_IGNORED, IN_ONLYDIR, IN_CLOEXEC = 0x8000, 0x01000000, 0x80000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+class InotifyWatcher:
+    def __init__(self, callback):
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.callback = callback
+        threading.Thread(target=self.run, name='inotify', daemon=True).start()
+
+    def add(self, path):
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(path), IN_WATCH_MASK | IN_ONLYDIR)
+        return wd if wd >= 0 else None
+
+    def remove(self, wd):
+        libc.inotify_rm_watch(self.fd, wd)
+
+    def run(self):
+        while True:
+            data = os.read(self.fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size + length
+                self.callback(wd, bool(mask & IN_IGNORED))
+
+class DirectoryCache:
+    def __init__(self, max_dirs=FS_CACHE_MAX_DIRS):
+        self.max_dirs, self.lock = max_dirs, threading.Lock()
+        self.entries, self.wds, self.scanning, self.dirty = OrderedDict(), {}, set(), set()
+        self.watcher = None if libc else False
+
+    def _watch(self, path):
+        # Returns the watch descriptor, or None when listings have to fall back to mtime checks.
+        if self.watcher is None:
+            try: self.watcher = InotifyWatcher(self._on_event)
+            except OSError: self.watcher = False
+        if not self.watcher: return None
+        wd = self.watcher.add(path)
+        if wd is not None: self.wds[wd] = path
+        return wd
+
+    def _unwatch(self, wd):
+        if self.wds.pop(wd, None) is not None: self.watcher.remove(wd)
+
+    def _drop(self, path):
+        # Called with self.lock held.
+        if path in self.scanning: self.dirty.add(path)
+        entry = self.entries.pop(path, None)
+        if entry and entry['wd'] is not None: self._unwatch(entry['wd'])
+
+    def _on_event(self, wd, ignored):
+        with self.lock:
+            path = self.wds.pop(wd, None) if ignored else self.wds.get(wd)  # IN_IGNORED: the kernel already dropped the watch.
+            if path is not None: self._drop(path)
+
+    def invalidate(self, path):
+        with self.lock: self._drop(os.path.abspath(path))
+
+    def _fresh(self, path, entry):
+        if entry['wd'] is not None: return True
+        if time.monotonic() - entry['loaded'] > FS_CACHE_TTL: return False
+        try: return os.stat(path).st_mtime_ns == entry['stamp']
+        except OSError: return False
+
+    def _scan(self, path):
+        items = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    st = entry.stat()
+                except OSError: continue  # Vanished or unreadable between readdir and stat.
+                items.append({'name': entry.name, 'type': 'dir' if is_dir else 'file', 'size': 0 if is_dir else st.st_size, 'mtime': int(st.st_mtime)})
+        return items
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and self._fresh(path, entry):
+                self.entries.move_to_end(path)
+                return entry
+            if entry: self._drop(path)
+            wd = self._watch(path)
+            self.scanning.add(path)
+        try:
+            stamp = os.stat(path).st_mtime_ns
+            entry = {'items': self._scan(path), 'orders': {}, 'stamp': stamp, 'loaded': time.monotonic(), 'wd': wd}
+        except OSError:
+            with self.lock:
+                self.scanning.discard(path); self.dirty.discard(path)
+                if wd is not None: self._unwatch(wd)
+            raise
+        with self.lock:
+            self.scanning.discard(path)
+            if path in self.dirty:
+                self.dirty.discard(path)  # Changed while scanning: serve this listing once but don't keep it.
+                if wd is not None: self._unwatch(wd)
+                entry['wd'] = None
+                return entry
+            self.entries[path] = entry
+            while len(self.entries) > self.max_dirs:
+                old_path, old = self.entries.popitem(last=False)
+                if old['wd'] is not None: self._unwatch(old['wd'])
+        return entry
+
+    def page(self, path, sort='name', descending=False, cursor=None, limit=FS_PAGE_SIZE):
+        # Directories always come first. A cursor is '<offset>:<name of the last item sent>'; paging resumes
+        # after that name if it still exists, else at the offset.
+        entry = self.get(path)
+        key = (sort if sort in FS_SORT_KEYS else 'name', bool(descending))
+        order = entry['orders'].get(key)
+        if order is None:
+            dirs = sorted((i for i in entry['items'] if i['type'] == 'dir'), key=FS_SORT_KEYS[key[0]], reverse=key[1])
+            files = sorted((i for i in entry['items'] if i['type'] != 'dir'), key=FS_SORT_KEYS[key[0]], reverse=key[1])
+            order = entry['orders'][key] = (dirs + files, {item['name']: n for n, item in enumerate(dirs + files)})
+        items, positions = order
+        start = 0
+        if cursor:
+            offset, _, name = str(cursor).partition(':')
+            start = positions[name] + 1 if name in positions else int(offset) if offset.isdigit() else 0
+        limit = max(1, min(FS_MAX_PAGE_SIZE, int(limit or FS_PAGE_SIZE)))
+        page = items[start:start + limit]
+        end = start + len(page)
+        return {'items': page, 'total': len(items), 'next_cursor': f"{end}:{page[-1]['name']}" if page and end < len(items) else None}
+
+directory_cache = DirectoryCache()
+
+# --- Search Index ---
+# A background indexer keeps, for every text file under each server's directory (binaries, files over
+# SEARCH_MAX_FILE_SIZE and backups/ are skipped), a compact filter of the hashed lowercase trigrams it
+# contains. Files are re-read only when their size or mtime changes. A query derives the trigrams every
+# match must contain (the literal itself, or the literal runs of a simple regex) and only opens files
+# whose filter has all of them, so most files are never read. Every filter is exact for 16-bit trigram
+# hashes: files with fewer than SEARCH_SMALL_FILTER hashes keep them sorted and packed two bytes each,
+# the rest an 8 KB bitmap, so no filter is ever larger than the bitmap.
+SEARCH_MAX_FILE_SIZE = 8 * 1024 * 1024
+SEARCH_REINDEX_INTERVAL = 60
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_CONTEXT = 10
+SEARCH_BITMAP_BYTES = 8192
+SEARCH_SMALL_FILTER = SEARCH_BITMAP_BYTES // 2  # A packed list this long would be as big as the bitmap.
+
+def trigram_hashes(text):
+    return {hash(gram) & 0xFFFF for gram in zip(text, text[1:], text[2:])}
+
+def trigram_filter(text):
+    hashes = trigram_hashes(text.lower())
+    if len(hashes) < SEARCH_SMALL_FILTER: return array.array('H', sorted(hashes)).tobytes()
+    bitmap = bytearray(SEARCH_BITMAP_BYTES)
+    for h in hashes: bitmap[h >> 3] |= 1 << (h & 7)
+    return bytes(bitmap)
+
+def filter_has(grams, hashes):
+    if len(grams) < SEARCH_BITMAP_BYTES:
+        packed = memoryview(grams).cast('H')
+        for h in hashes:
+            i = bisect.bisect_left(packed, h)
+            if i == len(packed) or packed[i] != h: return False
+        return True
+    return all(grams[h >> 3] & (1 << (h & 7)) for h in hashes)
+
+def regex_literals(pattern):
+    # Literal runs that every match of the pattern must contain, or [] if that can't be worked out simply.
+    if any(c in pattern for c in '|()'): return []
+    runs, run, i = [], '', 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            nxt = pattern[i + 1:i + 2]
+            if nxt and not nxt.isalnum(): run += nxt
+            else: runs.append(run); run = ''
+            i += 2; continue
+        if c in '?*{':
+            runs.append(run[:-1]); run = ''
+            if c == '{': i = pattern.find('}', i) if '}' in pattern[i:] else len(pattern)
+        elif c == '[':
+            runs.append(run); run = ''
+            i = pattern.find(']', i + 2) if ']' in pattern[i + 2:] else len(pattern)
+        elif c in '.^$+':
+            runs.append(run); run = ''
+        else: run += c
+        i += 1
+    runs.append(run)
+    return [r for r in runs if len(r) >= 3]
+
+class SearchIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}  # server id -> {relative path: (size, mtime_ns, trigram filter or None for binaries)}
+        self.ready = set()
+
+    def refresh(self, server_id):
+        root, error = get_safe_path(server_id, '')
+        if error or not os.path.isdir(root): return
+        previous = self.files.get(server_id, {})
+        current = {}
+        for rel, st in scan_tree(root)[0]:
+            if st.st_size > SEARCH_MAX_FILE_SIZE: continue
+            old = previous.get(rel)
+            if old and old[0] == st.st_size and old[1] == st.st_mtime_ns: current[rel] = old; continue
+            current[rel] = (st.st_size, st.st_mtime_ns, self._index_file(os.path.join(root, rel)))
+        with self.lock:
+            self.files[server_id] = current
+            self.ready.add(server_id)
+
+    def _index_file(self, path):
+        try:
+            with open(path, 'rb') as f: data = f.read(SEARCH_MAX_FILE_SIZE)
+        except OSError: return None
+        if b'\0' in data[:8192]: return None
+        return trigram_filter(data.decode('utf-8', errors='replace'))
+
+    def touch(self, server_id, rel):
+        # Re-index one file right away (e.g. after it was saved from the panel).
+        root, error = get_safe_path(server_id, '')
+        if error or server_id not in self.files: return
+        path = get_safe_path(server_id, rel)[0]
+        rel = os.path.relpath(path, root).replace(os.sep, '/')
+        try: st = os.stat(path)
+        except OSError: return
+        entry = (st.st_size, st.st_mtime_ns, self._index_file(path)) if st.st_size <= SEARCH_MAX_FILE_SIZE else None
+        with self.lock:
+            files = dict(self.files.get(server_id, {}))
+            if entry: files[rel] = entry
+            else: files.pop(rel, None)
+            self.files[server_id] = files
+
+    def discard(self, server_id):
+        with self.lock: self.files.pop(server_id, None); self.ready.discard(server_id)
+
+    def run(self):
+        while True:
+            for server in list(servers_store.get()):
+                try: self.refresh(server['id'])
+                except Exception as e: print(f"SEARCH: Could not index '{server['id']}': {e}")
+            time.sleep(SEARCH_REINDEX_INTERVAL)
+
+    def search(self, query, server_ids, regex=False, case_sensitive=False, cursor=0, limit=SEARCH_PAGE_SIZE, context=2):
+        flags = 0 if case_sensitive else re.IGNORECASE
+        matcher = re.compile(query if regex else re.escape(query), flags)
+        required = [trigram_hashes(lit.lower()) for lit in (regex_literals(query) if regex else [query])]
+        with self.lock: snapshot = {sid: self.files.get(sid, {}) for sid in server_ids}
+        hits, skip, scanned = [], int(cursor or 0), 0
+        context = max(0, min(SEARCH_MAX_CONTEXT, int(context)))
+        for server_id in sorted(snapshot):
+            root = get_safe_path(server_id, '')[0]
+            for rel in sorted(snapshot[server_id]):
+                grams = snapshot[server_id][rel][2]
+                if grams is None or not all(filter_has(grams, h) for h in required): continue
+                try:
+                    with open(os.path.join(root, rel), 'r', encoding='utf-8', errors='replace') as f: lines = f.read(SEARCH_MAX_FILE_SIZE).splitlines()
+                except OSError: continue
+                scanned += 1
+                for n, line in enumerate(lines):
+                    if not matcher.search(line): continue
+                    if skip: skip -= 1; continue
+                    if len(hits) == limit:
+                        return {'hits': hits, 'next_cursor': int(cursor or 0) + limit, 'files_scanned': scanned}
+                    hits.append({'id': server_id, 'path': rel, 'line': n + 1, 'text': line[:500],
+                                 'before': [l[:500] for l in lines[max(0, n - context):n]], 'after': [l[:500] for l in lines[n + 1:n + 1 + context]]})
+        return {'hits': hits, 'next_cursor': None, 'files_scanned': scanned}
+
+search_index = SearchIndex()
+
+# --- File Reader ---
+# Files up to FILE_EDIT_MAX_BYTES open whole in the editor. Larger ones are read through mmap in windows
+# of whole lines, addressed by byte offset, by line number, or from the end. Line numbers come from a
+# per-file index of newline counts at every FILE_INDEX_CHUNK boundary, which is extended rather than
+# rebuilt when a log grows: it is reused as is while the file's size and mtime match, and extended only
+# when the file is the same inode and the bytes sampled at its start and old end are unchanged (a pure
+# append); anything else, a rewrite or a rotation, rebuilds it. Saving a window writes in place when its byte length is unchanged and the
+# file has no other links; otherwise the file is rewritten through a temp file, streaming the bytes
+# outside the window, so a file hardlinked from a shared depot is never changed for its siblings.
+# 'tail' subscribers get appended bytes only.
+FILE_EDIT_MAX_BYTES = 5 * 1024 * 1024
+FILE_WINDOW_BYTES = 256 * 1024
+FILE_MAX_WINDOW_BYTES = 4 * 1024 * 1024
+FILE_INDEX_CHUNK = 4 * 1024 * 1024
+FILE_INDEX_CACHE_FILES = 32
+FILE_INDEX_SAMPLE = 64
+TAIL_INTERVAL = 0.5
+TAIL_MAX_BYTES = 256 * 1024
+
+line_index_cache, line_index_lock = OrderedDict(), threading.Lock()
+
+def line_checkpoints(path, mm, size, build=True):
+    # checkpoints[i] is the number of newlines before byte i * FILE_INDEX_CHUNK (full chunks only).
+    # With build=False, returns None unless an index exists that needs at most one more chunk counted.
+    st = os.stat(path)
+    head, tail = mm[:FILE_INDEX_SAMPLE], mm[max(0, size - FILE_INDEX_SAMPLE):size]
+    with line_index_lock:
+        cached = line_index_cache.get(path)
+        if cached and cached['ino'] == st.st_ino and ((cached['size'], cached['mtime_ns']) == (size, st.st_mtime_ns) or (
+                cached['size'] < size and cached['head'] == mm[:len(cached['head'])] and cached['tail'] == mm[cached['size'] - len(cached['tail']):cached['size']])):
+            checkpoints = list(cached['checkpoints'])
+        else: checkpoints = [0]
+    if not build and len(checkpoints) - 1 < size // FILE_INDEX_CHUNK - 1: return None
+    for chunk in range(len(checkpoints) - 1, size // FILE_INDEX_CHUNK):
+        start = chunk * FILE_INDEX_CHUNK
+        checkpoints.append(checkpoints[-1] + mm[start:start + FILE_INDEX_CHUNK].count(b'\n'))
+    with line_index_lock:
+        line_index_cache[path] = {'size': size, 'mtime_ns': st.st_mtime_ns, 'ino': st.st_ino, 'head': head, 'tail': tail, 'checkpoints': checkpoints}
+        line_index_cache.move_to_end(path)
+        while len(line_index_cache) > FILE_INDEX_CACHE_FILES: line_index_cache.popitem(last=False)
+    return checkpoints
+
+def line_to_offset(path, mm, size, line):
+    # Byte offset where 0-based line 'line' starts (size if the file has fewer lines).
+    if line <= 0: return 0
+    checkpoints = line_checkpoints(path, mm, size)
+    chunk = max(0, bisect.bisect_left(checkpoints, line) - 1)
+    pos, remaining = chunk * FILE_INDEX_CHUNK, line - checkpoints[chunk]
+    while remaining:
+        nl = mm.find(b'\n', pos)
+        if nl == -1: return size
+        pos, remaining = nl + 1, remaining - 1
+    return pos
+
+def offset_to_line(path, mm, size, offset, build=True):
+    checkpoints = line_checkpoints(path, mm, size, build)
+    if checkpoints is None: return None
+    chunk = min(offset // FILE_INDEX_CHUNK, len(checkpoints) - 1)
+    return checkpoints[chunk] + mm[chunk * FILE_INDEX_CHUNK:offset].count(b'\n')
+
+def read_file_window(path, offset=0, line=None, length=FILE_WINDOW_BYTES, from_end=False):
+    st = os.stat(path)
+    size, length = st.st_size, max(1, min(FILE_MAX_WINDOW_BYTES, int(length or FILE_WINDOW_BYTES)))
+    window = {'offset': 0, 'end': 0, 'size': size, 'mtime_ns': st.st_mtime_ns, 'first_line': 0, 'content': '', 'editable': True, 'eof': True}
+    if size == 0: return window
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if line is not None: start = line_to_offset(path, mm, size, int(line))
+        elif from_end:
+            start = max(0, size - length)
+            if start and mm[start - 1:start] != b'\n':  # Snap forward so the window still ends at EOF.
+                nl = mm.find(b'\n', start)
+                if nl != -1 and nl + 1 < size: start = nl + 1
+        else:
+            start = min(max(0, int(offset or 0)), size)
+            if start and mm[start - 1:start] != b'\n': start = mm.rfind(b'\n', 0, start) + 1
+        end = min(size, start + length)
+        if end < size:
+            nl = mm.rfind(b'\n', start, end)
+            if nl != -1: end = nl + 1
+        data = mm[start:end]
+        # Jumping to the end should not force a full-file line count; the number is filled in once indexed.
+        first_line = offset_to_line(path, mm, size, start, build=not from_end)
+    try: content, editable = data.decode('utf-8'), True
+    except UnicodeDecodeError: content, editable = data.decode('utf-8', errors='replace'), False
+    window.update(offset=start, end=end, first_line=first_line, content=content, editable=editable, eof=end >= size)
+    return window
+
+def copy_range(src, dst, start, length):
+    src.seek(start)
+    while length > 0:
+        data = src.read(min(length, 1024 * 1024))
+        if not data: break
+        dst.write(data); length -= len(data)
+
+def write_file_range(path, offset, length, content, expected_size, expected_mtime_ns):
+    st = os.stat(path)
+    if st.st_size != expected_size or st.st_mtime_ns != expected_mtime_ns:
+        raise ValueError('The file changed on disk since it was opened. Reload it before saving.')
+    if offset < 0 or length < 0 or offset + length > st.st_size: raise ValueError('Invalid range.')
+    with open(path, 'rb') as f:
+        f.seek(offset); original = f.read(length)
+    if b'\r\n' in original: content = content.replace('\r\n', '\n').replace('\n', '\r\n')  # Browsers strip CRs from textareas.
+    data = content.encode('utf-8')
+    with line_index_lock: line_index_cache.pop(path, None)
+    if len(data) == length and st.st_nlink == 1:
+        with open(path, 'r+b') as f: f.seek(offset); f.write(data)
+        return
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.pp-save-')
+    try:
+        with os.fdopen(fd, 'wb') as dst, open(path, 'rb') as src:
+            copy_range(src, dst, 0, offset)
+            dst.write(data)
+            copy_range(src, dst, offset + length, st.st_size - offset - length)
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+def replace_file_text(path, content):
+    # Whole-file editor saves. Replacing instead of truncating breaks any hardlink to a shared depot.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.pp-save-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f: f.write(content)
+        if os.path.exists(path): shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+class FileTailer:
+    def __init__(self):
+        self.lock, self.watches = threading.Lock(), {}  # room -> {'id', 'rel', 'path', 'offset'}
+
+    def watch(self, room, server_id, rel, path):
+        with self.lock:
+            if room not in self.watches: self.watches[room] = {'id': server_id, 'rel': rel, 'path': path, 'offset': os.path.getsize(path)}
+
+    def read_since(self, path, offset, size):
+        # Returns (start, end, text, skipped); only whole lines are sent unless a single line is huge.
+        start = max(offset, size - TAIL_MAX_BYTES)
+        with open(path, 'rb') as f:
+            f.seek(start); data = f.read(size - start)
+        cut = data.rfind(b'\n') + 1
+        if cut or len(data) >= TAIL_MAX_BYTES: data = data[:cut or len(data)]
+        else: data = b''
+        return start, start + len(data), data.decode('utf-8', errors='replace'), start > offset
+
+    def catch_up(self, server_id, rel, path, offset, sid):
+        size = os.path.getsize(path)
+        if offset > size: offset = 0
+        if offset < size:
+            start, end, text, skipped = self.read_since(path, offset, size)
+            if text: socketio.emit('file_append', {'id': server_id, 'path': rel, 'offset': start, 'end': end, 'data': text, 'skipped': skipped, 'reset': offset == 0}, to=sid)
+
+    def run(self):
+        while True:
+            with self.lock: watches = list(self.watches.items())
+            for room, watch in watches:
+                try:
+                    if not room_has_members(room): raise FileNotFoundError
+                    size = os.path.getsize(watch['path'])
+                except OSError:
+                    with self.lock: self.watches.pop(room, None)
+                    continue
+                reset = size < watch['offset']  # Truncated or rotated.
+                if reset: watch['offset'] = 0
+                if size == watch['offset']: continue
+                start, end, text, skipped = self.read_since(watch['path'], watch['offset'], size)
+                if not text: continue
+                watch['offset'] = end
+                socketio.emit('file_append', {'id': watch['id'], 'path': watch['rel'], 'offset': start, 'end': end, 'data': text, 'skipped': skipped, 'reset': reset}, to=room)
+            socketio.sleep(TAIL_INTERVAL)
+
+file_tailer = FileTailer()
+
+# --- Panel Metrics ---
+# Gauges read at scrape time. Executor queue depths come from ThreadPoolExecutor's internal work queue.
+panel_process = psutil.Process()
+
+def collect_panel_metrics():
+    yield 'pulse_threads', (), threading.active_count()
+    for name, executor in (('backup', backup_executor), ('chunk', chunk_executor), ('schedule', schedule_executor), ('log_compress', console_logs.compressor)):
+        yield 'pulse_executor_queue_depth', (('executor', name),), executor._work_queue.qsize()
+    with steam_jobs.cond: queued, running = len(steam_jobs.queue), len(steam_jobs.active)
+    yield 'pulse_steam_jobs', (('state', 'queued'),), queued
+    yield 'pulse_steam_jobs', (('state', 'running'),), running
+    with schedule_lock:
+        yield 'pulse_schedule_pending', (), len(schedule_pending) + sum(map(len, schedule_ready.values()))
+        for action in SCHEDULE_ACTION_LIMITS: yield 'pulse_schedule_running', (('action', action),), schedule_running.get(action, 0)
+    with console_pipeline.lock: pending = sum(buf['size'] for buf in console_pipeline.pending.values())
+    yield 'pulse_console_pending_chars', (), pending
+    yield 'pulse_console_history_bytes', (), console_scrollback.total
+    yield 'pulse_pipes_open', (), len(pipe_mux.readers)
+    with panel_process.oneshot():
+        yield 'pulse_process_cpu_seconds_total', (), round(sum(panel_process.cpu_times()[:2]), 3)
+        yield 'pulse_process_resident_bytes', (), panel_process.memory_info().rss
+    for server_id, (state, cpu, mem) in list(fleet_latest.items()):
+        yield 'pulse_server_cpu_percent', (('server', server_id),), cpu
+        yield 'pulse_server_memory_mb', (('server', server_id),), mem
+        yield 'pulse_server_state', (('server', server_id), ('state', state)), 1
+
+for _name, _kind, _text in (
+    ('pulse_threads', 'gauge', 'Live threads in the panel process.'),
+    ('pulse_executor_queue_depth', 'gauge', 'Tasks waiting for a thread pool worker.'),
+    ('pulse_steam_jobs', 'gauge', 'SteamCMD jobs by state.'),
+    ('pulse_schedule_pending', 'gauge', 'Scheduled tasks waiting for their stagger offset or a free slot.'),
+    ('pulse_schedule_running', 'gauge', 'Scheduled tasks running by action.'),
+    ('pulse_console_pending_chars', 'gauge', 'Console output waiting for the next flush.'),
+    ('pulse_console_history_bytes', 'gauge', 'Console scrollback held in memory.'),
+    ('pulse_pipes_open', 'gauge', 'Server output pipes owned by the pipe multiplexer.'),
+    ('pulse_process_cpu_seconds_total', 'counter', 'CPU time used by the panel process.'),
+    ('pulse_process_resident_bytes', 'gauge', 'Resident memory of the panel process.'),
+    ('pulse_server_cpu_percent', 'gauge', 'Server CPU usage from the last sampler sweep.'),
+    ('pulse_server_memory_mb', 'gauge', 'Server memory usage from the last sampler sweep.'),
+    ('pulse_server_state', 'gauge', 'Lifecycle state of each server (1 for the current state).'),
+):
+    panel_metrics.describe(_name, _kind, _text)
+panel_metrics.collectors.append(collect_panel_metrics)
+
+# --- Sampling Profiler ---
+# Opt-in: while running, a thread samples every thread's Python stack every PROFILE_INTERVAL and counts
+# identical stacks. Stopping writes them to profiles/ in the folded format ("thread;outer;inner count")
+# that flamegraph.pl and speedscope read directly. It stops by itself after PROFILE_MAX_SECONDS, writing
+# the profile the same way.
+PROFILE_DIR = 'profiles'
+PROFILE_INTERVAL = 0.01
+PROFILE_MAX_SECONDS = 600
+
+class SamplingProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread, self.stop_event = None, threading.Event()
+        self.stacks, self.samples, self.started, self.file = {}, 0, None, None
+
+    def status(self):
+        return {'running': bool(self.thread and self.thread.is_alive()), 'samples': self.samples, 'started': self.started, 'file': self.file}
+
+    def start(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive(): return False
+            self.stacks, self.samples, self.started = {}, 0, time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self.thread.start()
+            return True
+
+    def _run(self):
+        own, deadline = threading.get_ident(), time.monotonic() + PROFILE_MAX_SECONDS
+        while not self.stop_event.wait(PROFILE_INTERVAL) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own: continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                key = ';'.join([names.get(ident, str(ident))] + stack[::-1])
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+        # Hit the deadline: save like stop() would, unless stop() is already doing it (it holds the lock
+        # and is waiting for this thread).
+        while not self.lock.acquire(timeout=0.1):
+            if self.stop_event.is_set(): return
+        try:
+            if self.stop_event.is_set() or self.thread is not threading.current_thread(): return
+            self.thread = None
+            name = self._write()
+        finally: self.lock.release()
+        socketio.emit('notification', {'status': 'info', 'message': f'Profiler stopped after {PROFILE_MAX_SECONDS}s. Profile saved: {name} ({self.samples} samples)'})
+        socketio.emit('profiler_status', self.status())
+
+    def _write(self):
+        # Called with self.lock held.
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+        with open(os.path.join(PROFILE_DIR, name), 'w', encoding='utf-8') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+        self.file = name
+        return name
+
+    def stop(self):
+        # Returns the file name of the written profile, or None if it wasn't running.
+        with self.lock:
+            if not self.thread: return None
+            self.stop_event.set(); self.thread.join(); self.thread = None
+            return self._write()
+
+profiler = SamplingProfiler()
 
 # --- Flask Routes ---
 @app.route('/')
 def index():
     with open('dashboard.html', 'r', encoding='utf-8') as f: html_content = f.read()
-    return render_template_string(html_content, servers=load_json_file(SERVERS_FILE), games=load_json_file(GAMES_FILE), config=load_config())
+    return render_template_string(html_content, servers=servers_store.get(), games=games_store.get(), config=load_config(), backup_codecs=list(BACKUP_CODECS))
 
 @app.route('/download_backup/<server_id>/<filename>')
 def download_backup(server_id, filename):
@@ -219,129 +2891,219 @@ def download_backup(server_id, filename):
     if error: return "Invalid path", 400
     if not os.path.abspath(os.path.join(backups_dir, filename)).startswith(backups_dir):
         return "Access denied", 403
+    if filename.endswith('.json'):
+        if filename not in list_manifests(backups_dir): return "Backup not found", 404
+        headers = {'Content-Disposition': f'attachment; filename="{filename[:-5]}.zip"'}
+        return Response(export_backup_zip(os.path.dirname(backups_dir), filename), mimetype='application/zip', headers=headers)
     return send_from_directory(directory=backups_dir, path=filename, as_attachment=True)
 
+@app.route('/metrics')
+def metrics():
+    return Response(panel_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles/<filename>')
+def download_profile(filename):
+    return send_from_directory(directory=os.path.abspath(PROFILE_DIR), path=filename, as_attachment=True)
+
+def parse_log_time(value, default):
+    if value in (None, ''): return default
+    try: return float(value)
+    except (TypeError, ValueError): return datetime.fromisoformat(str(value)).timestamp()
+
+@app.route('/console_log/<server_id>')
+def console_log(server_id):
+    # e.g. /console_log/<id>?start=2026-01-02T02:55&end=2026-01-02T03:05 (local time, or epoch seconds)
+    if server_id != 'steamcmd' and not get_server_config(server_id): return "Server not found", 404
+    try:
+        end = parse_log_time(request.args.get('end'), time.time())
+        start = parse_log_time(request.args.get('start'), end - 3600)
+    except ValueError: return "Invalid time", 400
+    result = console_logs.read(server_id, start, end)
+    text = result['text'] + ('\n--- Output truncated; narrow the time range ---\n' if result['truncated'] else '')
+    return Response(text, mimetype='text/plain')
+
 # --- Socket.IO Handlers ---
 @socketio.on('get_performance_history')
 def handle_get_performance_history(data):
+    # Without a range this returns the live window (last MAX_PERF_DATA_POINTS raw samples). 'start'/'end' are
+    # unix timestamps; 'resolution' is 'raw', '1m', '1h' or 'auto' (finest tier that fits in 'max_points').
     server_id = data.get('id')
-    if server_id in performance_data:
-        history = { 'cpu': list(performance_data[server_id]['cpu']), 'mem': list(performance_data[server_id]['mem']) }
-        socketio.emit('performance_history', {'id': server_id, 'history': history})
+    if not get_server_config(server_id): return
+    end = float(data.get('end') or time.time())
+    start = float(data.get('start') or end - MAX_PERF_DATA_POINTS * MONITOR_INTERVAL)
+    max_points = min(int(data.get('max_points') or METRICS_MAX_POINTS), METRICS_MAX_POINTS)
+    tier = metrics_store.pick_tier(start, end, data.get('resolution') or 'auto', max_points)
+    history = metrics_store.query(server_id, start, end, tier)
+    socketio.emit('performance_history', {'id': server_id, 'resolution': tier, 'step': METRICS_TIERS[tier][0], 'history': history})
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    channel = data.get('channel')
+    room = subscription_room(channel, data.get('id'), data.get('path'))
+    if not room: return
+    if channel == 'tail':
+        path, error = get_safe_path(data.get('id'), data.get('path'))
+        if error or not os.path.isfile(path): return
+        join_room(room)
+        file_tailer.watch(room, data.get('id'), data.get('path'), path)
+        if data.get('offset') is not None: file_tailer.catch_up(data.get('id'), data.get('path'), path, int(data['offset']), request.sid)
+        return
+    join_room(room)
+    if channel == 'console': handle_get_console_history(data)
+    elif channel == 'fleet': socketio.emit('fleet_status', {'servers': fleet_state, 'removed': [], 'full': True}, to=request.sid)
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    room = subscription_room(data.get('channel'), data.get('id'), data.get('path'))
+    if room: leave_room(room)
+
+@socketio.on('get_console_history')
+def handle_get_console_history(data):
+    server_id, since, max_lines = data.get('id'), data.get('since'), data.get('max_lines')
+    max_bytes = min(int(data.get('max_bytes') or CONSOLE_REPLAY_DEFAULT_BYTES), CONSOLE_HISTORY_SERVER_BYTES)
+    history = console_pipeline.replay(server_id, int(since or 0), max_bytes, int(max_lines) if max_lines else None)
+    socketio.emit('console_history', {'id': server_id, **history}, to=request.sid)
+
+@socketio.on('set_profiler')
+def handle_set_profiler(data):
+    if data.get('enabled'):
+        if profiler.start(): socketio.emit('notification', {'status': 'info', 'message': 'Profiler started.'})
+        socketio.emit('profiler_status', profiler.status()); return
+    samples, name = profiler.samples, profiler.stop()
+    if name: socketio.emit('notification', {'status': 'success', 'message': f'Profile saved: {name} ({samples} samples)'})
+    socketio.emit('profiler_status', dict(profiler.status(), file=name))
+
+@socketio.on('get_profiler_status')
+def handle_get_profiler_status(data=None):
+    socketio.emit('profiler_status', profiler.status(), to=request.sid)
 
 @socketio.on('save_settings')
 def handle_save_settings(data):
-    save_json_file(CONFIG_FILE, {'steamcmd_path': data.get('steamcmd_path', '')})
+    settings = {'steamcmd_path': data.get('steamcmd_path', '')}
+    if data.get('backup_codec') in BACKUP_CODECS: settings['backup_codec'] = data['backup_codec']
+    if str(data.get('backup_level', '')).isdigit(): settings['backup_level'] = int(data['backup_level'])
+    if str(data.get('steamcmd_workers', '')).isdigit(): settings['steamcmd_workers'] = max(1, min(STEAMCMD_MAX_WORKERS, int(data['steamcmd_workers'])))
+    if 'shared_depots' in data: settings['shared_depots'] = bool(data['shared_depots'])
+    if str(data.get('schedule_jitter', '')).isdigit(): settings['schedule_jitter'] = int(data['schedule_jitter'])
+    if 'placement' in data: settings['placement'] = bool(data['placement'])
+    if str(data.get('placement_reserved', '')).isdigit(): settings['placement_reserved'] = int(data['placement_reserved'])
+    if isinstance(data.get('schedule_limits'), dict):
+        settings['schedule_limits'] = {action: max(1, int(limit)) for action, limit in data['schedule_limits'].items() if action in SCHEDULE_ACTION_LIMITS and str(limit).isdigit()}
+    config_store.update(lambda config: config.update(settings))
     socketio.emit('notification', {'status': 'success', 'message': 'Settings saved!'})
 
 @socketio.on('install_server')
 def handle_install_server(data):
     context_id = "main_installer"
-    global steam_process
     game_id, name, path = data.get('game_id'), data.get('server_name'), data.get('install_path')
     if not all([game_id, name, path]):
         socketio.emit('installer_output', {'data': '--- ERROR: All fields are required. ---\n', 'context_id': context_id}); return
-    if steam_process and steam_process.poll() is None:
-        socketio.emit('installer_output', {'data': '--- An installation is already in progress. ---\n', 'context_id': context_id}); return
     steam_path = load_config().get('steamcmd_path')
     if not steam_path or not os.path.exists(steam_path):
         socketio.emit('installer_output', {'data': f"--- ERROR: SteamCMD path invalid. Check Settings. ---\n", 'context_id': context_id}); return
-    game_config = next((g for g in load_json_file(GAMES_FILE) if g['id'] == game_id), None)
+    game_config = games_store.by_id(game_id)
     if not game_config:
         socketio.emit('installer_output', {'data': f"--- ERROR: Game config '{game_id}' not found. ---\n", 'context_id': context_id}); return
     try:
         if not os.path.exists(path): os.makedirs(path)
     except Exception as e:
         socketio.emit('installer_output', {'data': f"--- ERROR: Could not create directory '{path}'. {e} ---\n", 'context_id': context_id}); return
-    appid, steam_cmd = game_config['appid'], [steam_path, '+force_install_dir', os.path.abspath(path), '+login', 'anonymous', '+app_update', appid, 'validate', '+quit']
+    appid, new_id = game_config['appid'], f"{game_id.replace('_','')}_{int(time.time())}"
+    new_config = {"id": new_id, "name": f"{game_config['name']} - {name}", "start_command": "# Enter start command here.\n# Example: server.exe -log", "cwd": os.path.abspath(path), "appid": appid}
     try:
-        socketio.emit('installer_output', {'data': f'--- Starting SteamCMD for {game_config["name"]} ---\n', 'context_id': context_id})
-        steam_process = subprocess.Popen(steam_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
-        for stream in [steam_process.stdout, steam_process.stderr]: threading.Thread(target=read_installer_stream, args=(stream, context_id), daemon=True).start()
-        new_id = f"{game_id.replace('_','')}_{int(time.time())}"
-        servers = load_json_file(SERVERS_FILE)
-        new_config = {"id": new_id, "name": f"{game_config['name']} - {name}", "start_command": "# Enter start command here.\n# Example: server.exe -log", "cwd": os.path.abspath(path), "appid": appid}
-        servers.append(new_config)
-        save_json_file(SERVERS_FILE, servers)
-        socketio.emit('server_added', new_config)
+        if shared_depots_enabled():
+            # Registered before the job is queued, or a fast job would skip materializing the unknown server.
+            servers_store.update(lambda servers: servers.append(new_config))
+            socketio.emit('server_added', new_config)
+            job, merged = steam_jobs.submit('install', appid, depot_path(appid), game_config['name'], context_id, new_id)
+            socketio.emit('installer_output', {'data': f'--- Queued shared depot install for {game_config["name"]} (position {steam_jobs.position(job)}) ---\n', 'context_id': context_id})
+        else:
+            job, merged = steam_jobs.submit('install', appid, path, game_config['name'], context_id)
+            if merged:
+                socketio.emit('installer_output', {'data': '--- An install into this folder is already queued. ---\n', 'context_id': context_id}); return
+            socketio.emit('installer_output', {'data': f'--- Queued SteamCMD install for {game_config["name"]} (position {steam_jobs.position(job)}) ---\n', 'context_id': context_id})
+            servers_store.update(lambda servers: servers.append(new_config))
+            socketio.emit('server_added', new_config)
     except Exception as e: socketio.emit('installer_output', {'data': f'\n--- FATAL ERROR: {e} ---\n', 'context_id': context_id})
 
 @socketio.on('update_server')
 def handle_update_server(data):
-    global steam_process
     server_id, context_id = data.get('id'), f"updater_{data.get('id')}"
-    if steam_process and steam_process.poll() is None:
-        socketio.emit('installer_output', {'data': '--- Another SteamCMD process is running. Please wait. ---\n', 'context_id': context_id}); return
     steam_path = load_config().get('steamcmd_path')
     if not steam_path or not os.path.exists(steam_path):
         socketio.emit('installer_output', {'data': f"--- ERROR: SteamCMD path invalid. Check Settings. ---\n", 'context_id': context_id}); return
     server_config = get_server_config(server_id)
     if not server_config or 'appid' not in server_config:
         socketio.emit('installer_output', {'data': f"--- ERROR: Server config for '{server_id}' is invalid. ---\n", 'context_id': context_id}); return
-    path, appid = server_config['cwd'], server_config['appid']
-    steam_cmd = [steam_path, '+force_install_dir', os.path.abspath(path), '+login', 'anonymous', '+app_update', appid, 'validate', '+quit']
     try:
-        socketio.emit('installer_output', {'data': f'--- Starting update for {server_config["name"]} ---\n', 'context_id': context_id})
-        steam_process = subprocess.Popen(steam_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
-        for stream in [steam_process.stdout, steam_process.stderr]: threading.Thread(target=read_installer_stream, args=(stream, context_id), daemon=True).start()
+        if shared_depots_enabled():
+            job, merged = steam_jobs.submit('update', server_config['appid'], depot_path(server_config['appid']), server_config['name'], context_id, server_id)
+        else:
+            job, merged = steam_jobs.submit('update', server_config['appid'], server_config['cwd'], server_config['name'], context_id)
+        state = 'Joined queued update' if merged else 'Queued update'
+        socketio.emit('installer_output', {'data': f'--- {state} for {server_config["name"]} (position {steam_jobs.position(job)}) ---\n', 'context_id': context_id})
+        return job
     except Exception as e: socketio.emit('installer_output', {'data': f'\n--- FATAL ERROR during update: {e} ---\n', 'context_id': context_id})
 
+@socketio.on('get_jobs')
+def handle_get_jobs(data=None):
+    socketio.emit('jobs_list', {'jobs': steam_jobs.snapshot(), 'workers': steam_jobs.worker_limit()}, to=request.sid)
+
 @socketio.on('download_steamcmd')
 def handle_download_steamcmd(data):
-    install_path, url, context_id = data.get('path'), '[https://steamcdn-a.akamaihd.net/client/installer/steamcmd.zip](https://steamcdn-a.akamaihd.net/client/installer/steamcmd.zip)', "settings_installer"
+    install_path, context_id = data.get('path'), "settings_installer"
     if not install_path or not os.path.isdir(install_path):
         socketio.emit('installer_output', {'data': f"--- ERROR: Invalid folder path: '{install_path}' ---\n", 'context_id': context_id}); return
+    def progress(done, total, rate):
+        socketio.emit('download_progress', {'context_id': context_id, 'bytes_done': done, 'bytes_total': total, 'rate': round(rate)})
     try:
         socketio.emit('installer_output', {'data': f"--- Starting download... ---\n", 'context_id': context_id})
-        r = requests.get(url, stream=True); r.raise_for_status()
-        socketio.emit('installer_output', {'data': "--- Download complete. Extracting... ---\n", 'context_id': context_id})
-        with zipfile.ZipFile(io.BytesIO(r.content)) as z: z.extractall(install_path)
+        archive, cached = download_manager.fetch(STEAMCMD_URL, progress=progress, refresh=bool(data.get('refresh')))
+        state = 'Using cached copy' if cached else 'Download complete'
+        socketio.emit('installer_output', {'data': f"--- {state}. Extracting... ---\n", 'context_id': context_id})
+        with zipfile.ZipFile(archive) as z: z.extractall(install_path)
         final_path = os.path.join(install_path, 'steamcmd.exe')
         if os.path.exists(final_path):
             socketio.emit('installer_output', {'data': f"--- Success! Extracted to {final_path} ---\n", 'context_id': context_id})
-            save_json_file(CONFIG_FILE, {'steamcmd_path': final_path})
+            config_store.update(lambda config: config.update({'steamcmd_path': final_path}))
             socketio.emit('notification', {'status': 'success', 'message': 'SteamCMD installed and configured!'})
         else: socketio.emit('installer_output', {'data': "--- ERROR: steamcmd.exe not found. ---\n", 'context_id': context_id})
     except Exception as e: socketio.emit('installer_output', {'data': f"--- Error: {e} ---\n", 'context_id': context_id})
 
 @socketio.on('start_server')
 def handle_start_server(data):
-    server_id = data.get('id')
-    if server_id in server_processes and server_processes[server_id]['process'].poll() is None: return
-    config = get_server_config(server_id)
-    if not config: return
-    _start_server_process(server_id, config)
+    lifecycle.start(data.get('id'))
 
 @socketio.on('stop_server')
 def handle_stop_server(data):
-    _stop_server_process(data.get('id'))
+    lifecycle.stop(data.get('id'))
 
 @socketio.on('restart_server')
 def handle_restart_server(data):
     server_id = data.get('id')
-    config = get_server_config(server_id)
-    if not config: return
-    socketio.emit('console_output', {'id': server_id, 'data': f'\n--- Restarting server... ---\n'})
-    _stop_server_process(server_id)
-    time.sleep(5)
-    _start_server_process(server_id, config)
+    if not get_server_config(server_id): return
+    emit_console(server_id, f'\n--- Restarting server... ---\n')
+    lifecycle.restart(server_id)
 
 @socketio.on('send_command')
 def handle_send_command(data):
     server_id, command = data.get('id'), data.get('command')
-    if server_id in server_processes and command and server_processes[server_id]['process'].poll() is None:
-        try:
-            server_processes[server_id]['process'].stdin.write(command + '\n'); server_processes[server_id]['process'].stdin.flush()
-        except Exception as e: socketio.emit('console_output', {'id': server_id, 'data': f'\n--- Error: {e} ---\n'})
+    if command: write_server_stdin(server_id, command)
 
 @socketio.on('delete_server')
 def handle_delete_server(data):
     server_id, delete_files = data.get('id'), data.get('delete_files', False)
-    servers = load_json_file(SERVERS_FILE)
-    server_to_delete = next((s for s in servers if s['id'] == server_id), None)
+    server_to_delete = servers_store.by_id(server_id)
     if server_to_delete:
-        new_servers = [s for s in servers if s['id'] != server_id]
-        save_json_file(SERVERS_FILE, new_servers)
+        servers_store.remove_by_id(server_id)
+        console_scrollback.discard(server_id)
+        metrics_store.discard(server_id)
+        search_index.discard(server_id)
+        console_logs.discard(server_id)
+        lifecycle.discard(server_id)
+        if server_id in schedules_store.get():
+            schedules_store.update(lambda schedules: schedules.pop(server_id, None))
+            load_schedules()
         if delete_files:
             try:
                 if os.path.exists(server_to_delete['cwd']) and len(server_to_delete['cwd']) > 5:
@@ -354,29 +3116,62 @@ def handle_delete_server(data):
 
 @socketio.on('save_server_config')
 def handle_save_server_config(data):
-    server_id, start_command = data.get('id'), data.get('start_command')
-    servers = load_json_file(SERVERS_FILE)
-    if any(s['id'] == server_id for s in servers):
+    server_id, start_command, private_paths = data.get('id'), data.get('start_command'), data.get('private_paths')
+    if isinstance(private_paths, str): private_paths = [p.strip() for p in private_paths.split(',') if p.strip()]
+    def apply(servers):
         for s in servers:
-            if s['id'] == server_id: s['start_command'] = start_command; break
-        save_json_file(SERVERS_FILE, servers)
+            if s['id'] == server_id:
+                s['start_command'] = start_command
+                if private_paths is not None: s['private_paths'] = private_paths
+                return True
+        return False
+    if servers_store.by_id(server_id) and servers_store.update(apply):
         socketio.emit('notification', {'status': 'success', 'message': 'Start command saved!'})
     else: socketio.emit('notification', {'status': 'error', 'message': 'Error: Server not found.'})
 
+@socketio.on('save_lifecycle_config')
+def handle_save_lifecycle_config(data):
+    server_id, probe = data.get('id'), data.get('probe') or {}
+    if probe.get('type') == 'log':
+        try: re.compile(probe.get('pattern') or '')
+        except re.error as e:
+            socketio.emit('notification', {'status': 'error', 'message': f'Invalid readiness pattern: {e}'}); return
+    settings = {key: data.get(key) for key in ('stop_commands', 'stop_timeout', 'ready_timeout', 'auto_restart')}
+    settings = lifecycle_settings({'lifecycle': dict(settings, probe=probe)})
+    def apply(servers):
+        for s in servers:
+            if s['id'] == server_id: s['lifecycle'] = settings; return True
+        return False
+    if servers_store.by_id(server_id) and servers_store.update(apply):
+        socketio.emit('notification', {'status': 'success', 'message': 'Lifecycle settings saved!'})
+    else: socketio.emit('notification', {'status': 'error', 'message': 'Error: Server not found.'})
+
+@socketio.on('save_placement_config')
+def handle_save_placement_config(data):
+    server_id = data.get('id')
+    placement = placement_settings({'placement': {'weight': data.get('weight'), 'priority': data.get('priority')}})
+    def apply(servers):
+        for s in servers:
+            if s['id'] == server_id: s['placement'] = placement; return True
+        return False
+    if servers_store.by_id(server_id) and servers_store.update(apply):
+        socketio.emit('notification', {'status': 'success', 'message': 'Placement settings saved!'})
+    else: socketio.emit('notification', {'status': 'error', 'message': 'Error: Server not found.'})
+
+@socketio.on('get_placement')
+def handle_get_placement(data=None):
+    socketio.emit('placement_update', placement_engine.snapshot(), to=request.sid)
+
 @socketio.on('list_files')
 def handle_list_files(data):
     server_id, subdirectory = data.get('id'), data.get('path', '')
     path, error = get_safe_path(server_id, subdirectory)
     if error:
         socketio.emit('notification', {'status': 'error', 'message': error}); return
+    sort, descending, cursor = data.get('sort', 'name'), bool(data.get('descending')), data.get('cursor')
     try:
-        items = os.listdir(path)
-        files, dirs = [], []
-        for item in items:
-            if os.path.isdir(os.path.join(path, item)): dirs.append(item)
-            else: files.append(item)
-        dirs.sort(key=str.lower); files.sort(key=str.lower)
-        socketio.emit('file_list', {'id': server_id, 'path': subdirectory, 'dirs': dirs, 'files': files})
+        page = directory_cache.page(path, sort, descending, cursor, data.get('limit', FS_PAGE_SIZE))
+        socketio.emit('file_list', dict(page, id=server_id, path=subdirectory, sort=sort, descending=descending, cursor=cursor), to=request.sid)
     except Exception as e:
         socketio.emit('notification', {'status': 'error', 'message': f"Could not read directory: {e}"})
 
@@ -387,13 +3182,39 @@ def handle_get_file_content(data):
     if error:
         socketio.emit('file_content', {'path': file_path, 'content': None, 'error': error}); return
     try:
-        if os.path.getsize(path) > 5 * 1024 * 1024:
-             socketio.emit('file_content', {'path': file_path, 'content': None, 'error': 'File is too large to open (> 5MB).'}); return
+        if os.path.getsize(path) > FILE_EDIT_MAX_BYTES:
+            socketio.emit('file_range', {'id': server_id, 'path': file_path, **read_file_window(path)}, to=request.sid); return
         with open(path, 'r', encoding='utf-8', errors='ignore') as f: content = f.read()
         socketio.emit('file_content', {'path': file_path, 'content': content, 'error': None})
     except Exception as e:
         socketio.emit('file_content', {'path': file_path, 'content': None, 'error': f"Could not read file: {e}"})
 
+@socketio.on('read_file_range')
+def handle_read_file_range(data):
+    server_id, file_path = data.get('id'), data.get('path')
+    path, error = get_safe_path(server_id, file_path)
+    if error:
+        socketio.emit('notification', {'status': 'error', 'message': error}); return
+    try:
+        window = read_file_window(path, data.get('offset', 0), data.get('line'), data.get('length'), bool(data.get('from_end')))
+        socketio.emit('file_range', {'id': server_id, 'path': file_path, **window}, to=request.sid)
+    except Exception as e:
+        socketio.emit('notification', {'status': 'error', 'message': f"Could not read file: {e}"})
+
+@socketio.on('save_file_range')
+def handle_save_file_range(data):
+    server_id, file_path = data.get('id'), data.get('path')
+    path, error = get_safe_path(server_id, file_path)
+    if error:
+        socketio.emit('notification', {'status': 'error', 'message': error}); return
+    try:
+        write_file_range(path, int(data['offset']), int(data['length']), data.get('content', ''), int(data['size']), int(data['mtime_ns']))
+        search_index.touch(server_id, file_path)
+        socketio.emit('notification', {'status': 'success', 'message': f"Saved {os.path.basename(file_path)}"})
+        socketio.emit('file_range', {'id': server_id, 'path': file_path, **read_file_window(path, int(data['offset']), length=data.get('window'))}, to=request.sid)
+    except Exception as e:
+        socketio.emit('notification', {'status': 'error', 'message': f"Error saving file: {e}"})
+
 @socketio.on('save_file_content')
 def handle_save_file_content(data):
     server_id, file_path, content = data.get('id'), data.get('path'), data.get('content')
@@ -401,11 +3222,29 @@ def handle_save_file_content(data):
     if error:
         socketio.emit('notification', {'status': 'error', 'message': error}); return
     try:
-        with open(path, 'w', encoding='utf-8') as f: f.write(content)
+        replace_file_text(path, content)
+        directory_cache.invalidate(os.path.dirname(path))
+        search_index.touch(server_id, file_path)
         socketio.emit('notification', {'status': 'success', 'message': f"Saved {os.path.basename(file_path)}"})
     except Exception as e:
         socketio.emit('notification', {'status': 'error', 'message': f"Error saving file: {e}"})
 
+@socketio.on('search_files')
+def handle_search_files(data):
+    query, server_id = data.get('query') or '', data.get('id')
+    if not query:
+        socketio.emit('search_results', {'query': query, 'error': 'Enter something to search for.'}, to=request.sid); return
+    server_ids = [server_id] if server_id else [s['id'] for s in servers_store.get()]
+    started = time.perf_counter()
+    try:
+        result = search_index.search(query, server_ids, bool(data.get('regex')), bool(data.get('case_sensitive')),
+                                     data.get('cursor'), min(int(data.get('limit', SEARCH_PAGE_SIZE)), 500), data.get('context', 2))
+    except re.error as e:
+        socketio.emit('search_results', {'query': query, 'error': f"Invalid regex: {e}"}, to=request.sid); return
+    result.update(query=query, cursor=data.get('cursor'), elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+                  indexing=[sid for sid in server_ids if sid not in search_index.ready])
+    socketio.emit('search_results', result, to=request.sid)
+
 @socketio.on('create_item')
 def handle_create_item(data):
     server_id, path, item_type, name = data.get('id'), data.get('path'), data.get('type'), data.get('name')
@@ -419,6 +3258,7 @@ def handle_create_item(data):
             socketio.emit('notification', {'status': 'error', 'message': 'File or folder already exists.'}); return
         if item_type == 'file': open(full_path, 'a').close()
         elif item_type == 'folder': os.makedirs(full_path)
+        directory_cache.invalidate(os.path.dirname(full_path))
         socketio.emit('notification', {'status': 'success', 'message': f'Created {item_type}: {name}'})
         handle_list_files({'id': server_id, 'path': path})
     except Exception as e:
@@ -427,22 +3267,17 @@ def handle_create_item(data):
 @socketio.on('get_schedules')
 def handle_get_schedules(data):
     server_id = data.get('id')
-    schedules = load_json_file(SCHEDULES_FILE, is_dict=True)
-    server_schedules = schedules.get(server_id, [])
+    server_schedules = schedules_store.get().get(server_id, [])
     socketio.emit('schedule_list', {'id': server_id, 'schedules': server_schedules})
 
 @socketio.on('add_schedule')
 def handle_add_schedule(data):
     server_id = data.get('id')
-    schedules = load_json_file(SCHEDULES_FILE, is_dict=True)
-    if server_id not in schedules:
-        schedules[server_id] = []
     new_task = {
         'action': data.get('action'), 'interval': data.get('interval'),
         'unit': data.get('unit'), 'at_time': data.get('at_time')
     }
-    schedules[server_id].append(new_task)
-    save_json_file(SCHEDULES_FILE, schedules)
+    schedules_store.update(lambda schedules: schedules.setdefault(server_id, []).append(new_task))
     load_schedules()
     handle_get_schedules(data)
     socketio.emit('notification', {'status': 'success', 'message': 'New schedule added!'})
@@ -451,14 +3286,20 @@ def handle_add_schedule(data):
 def handle_delete_schedule(data):
     server_id = data.get('id')
     task_to_delete = data.get('task')
-    schedules = load_json_file(SCHEDULES_FILE, is_dict=True)
-    if server_id in schedules:
-        schedules[server_id] = [task for task in schedules[server_id] if task != task_to_delete]
-        save_json_file(SCHEDULES_FILE, schedules)
+    def apply(schedules):
+        schedules[server_id] = [task for task in schedules.get(server_id, []) if task != task_to_delete]
+    if server_id in schedules_store.get():
+        schedules_store.update(apply)
         load_schedules()
         handle_get_schedules(data)
     socketio.emit('notification', {'status': 'info', 'message': 'Schedule removed.'})
 
+@socketio.on('get_schedule_history')
+def handle_get_schedule_history(data):
+    server_id, limit = data.get('id'), min(int(data.get('limit') or 50), SCHEDULE_HISTORY_LIMIT)
+    runs = [run for run in schedule_history_store.get() if not server_id or run['server_id'] == server_id]
+    socketio.emit('schedule_history', {'id': server_id, 'runs': runs[-limit:][::-1]}, to=request.sid)
+
 @socketio.on('list_backups')
 def handle_list_backups(data):
     server_id = data.get('id')
@@ -469,50 +3310,65 @@ def handle_list_backups(data):
         os.makedirs(backups_dir)
     backup_files = []
     try:
+        for filename in list_manifests(backups_dir):
+            backup_files.append(manifest_summary(backups_dir, filename))
         for filename in os.listdir(backups_dir):
             if filename.endswith('.zip'):
                 file_path = os.path.join(backups_dir, filename)
                 stat = os.stat(file_path)
                 backup_files.append({
-                    'filename': filename,
+                    'filename': filename, 'type': 'zip',
                     'size_mb': round(stat.st_size / (1024 * 1024), 2),
                     'created_at': datetime.fromtimestamp(stat.st_ctime).strftime('%Y-%m-%d %H:%M:%S')
                 })
         backup_files.sort(key=lambda x: x['created_at'], reverse=True)
     except Exception as e:
         socketio.emit('notification', {'status': 'error', 'message': f'Error reading backups: {e}'})
-    socketio.emit('backup_list', {'id': server_id, 'backups': backup_files})
+    socketio.emit('backup_list', {'id': server_id, 'backups': backup_files, 'snapshot': snapshot_settings(get_server_config(server_id))})
+
+@socketio.on('save_snapshot_config')
+def handle_save_snapshot_config(data):
+    server_id, save_paths = data.get('id'), data.get('save_paths') or []
+    if isinstance(save_paths, str): save_paths = save_paths.split(',')
+    snapshot = {'save_command': (data.get('save_command') or '').strip(), 'save_paths': save_paths, 'save_wait': data.get('save_wait', SNAPSHOT_SAVE_WAIT)}
+    snapshot = snapshot_settings({'snapshot': snapshot})
+    def apply(servers):
+        for s in servers:
+            if s['id'] == server_id: s['snapshot'] = snapshot; return True
+        return False
+    if servers_store.by_id(server_id) and servers_store.update(apply):
+        socketio.emit('notification', {'status': 'success', 'message': 'Snapshot settings saved!'})
+    else: socketio.emit('notification', {'status': 'error', 'message': 'Error: Server not found.'})
 
 def _create_backup_task(server_id, is_scheduled=False):
-    if not backup_process_lock.acquire(blocking=False):
-        if not is_scheduled:
-            socketio.emit('notification', {'status': 'error', 'message': 'Another backup/restore is already in progress.'})
+    lock = server_backup_lock(server_id)
+    if not lock.acquire(blocking=False):
+        if is_scheduled: print(f"SCHEDULER: Skipping backup for '{server_id}', another backup/restore of it is running.")
+        socketio.emit('notification', {'status': 'info' if is_scheduled else 'error', 'message': 'A backup/restore of this server is already in progress.'})
         return
     try:
         server_config = get_server_config(server_id)
         if not server_config: return
-        if not is_scheduled and server_id in server_processes:
-            socketio.emit('notification', {'status': 'error', 'message': 'Stop server before creating a manual backup.'})
-            return
-        socketio.emit('notification', {'status': 'info', 'message': 'Starting backup... This may take a while.'})
-        source_dir = server_config['cwd']
-        backups_dir = os.path.join(source_dir, 'backups')
-        if not os.path.exists(backups_dir): os.makedirs(backups_dir)
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        filename = f"backup_{timestamp}"
-        archive_path = os.path.join(backups_dir, filename)
-        shutil.make_archive(archive_path, 'zip', root_dir=source_dir, base_dir='.', logger=None)
-        socketio.emit('notification', {'status': 'success', 'message': f'Backup created: {filename}.zip'})
+        running = server_id in server_processes and server_processes[server_id]['process'].poll() is None
+        codec, level = backup_codec_settings()
+        with backup_io_slots:
+            started = time.perf_counter()
+            if running: filename, manifest = create_hot_backup(server_id, server_config, codec, level)
+            else: filename, manifest = create_incremental_backup(server_config['cwd'], server_id, codec, level)
+            panel_metrics.observe('pulse_backup_seconds', (('mode', 'hot' if running else 'cold'),), time.perf_counter() - started)
+        new_mb = round(manifest['stored_size'] / (1024 * 1024), 2)
+        socketio.emit('notification', {'status': 'success', 'message': f"Backup created: {filename} ({len(manifest['files'])} files, {new_mb} MB new)"})
         handle_list_backups({'id': server_id})
+        return filename
     except Exception as e:
         socketio.emit('notification', {'status': 'error', 'message': f'Backup failed: {e}'})
     finally:
-        backup_process_lock.release()
+        lock.release()
 
 @socketio.on('create_backup')
 def handle_create_backup(data):
     server_id = data.get('id')
-    threading.Thread(target=_create_backup_task, args=(server_id,), kwargs=data).start()
+    backup_executor.submit(_create_backup_task, server_id, is_scheduled=data.get('is_scheduled', False))
 
 @socketio.on('delete_backup')
 def handle_delete_backup(data):
@@ -522,14 +3378,21 @@ def handle_delete_backup(data):
         socketio.emit('notification', {'status': 'error', 'message': error}); return
     try:
         os.remove(path)
+        # Chunks no longer referenced by any manifest are reclaimed unless a backup is running right now
+        # (its chunks may not have a manifest yet); they'll be collected on a later delete.
+        lock = server_backup_lock(server_id)
+        if filename.endswith('.json') and lock.acquire(blocking=False):
+            try: collect_backup_garbage(get_server_config(server_id)['cwd'])
+            finally: lock.release()
         socketio.emit('notification', {'status': 'info', 'message': 'Backup deleted.'})
         handle_list_backups({'id': server_id})
     except Exception as e:
         socketio.emit('notification', {'status': 'error', 'message': f'Could not delete backup: {e}'})
 
-def _restore_backup_task(server_id, filename):
-    if not backup_process_lock.acquire(blocking=False):
-        socketio.emit('notification', {'status': 'error', 'message': 'Another backup/restore is already in progress.'})
+def _restore_backup_task(server_id, filename, paths=None, prune=False):
+    lock = server_backup_lock(server_id)
+    if not lock.acquire(blocking=False):
+        socketio.emit('notification', {'status': 'error', 'message': 'A backup/restore of this server is already in progress.'})
         return
     try:
         server_config = get_server_config(server_id)
@@ -537,28 +3400,36 @@ def _restore_backup_task(server_id, filename):
         if server_id in server_processes:
             socketio.emit('notification', {'status': 'error', 'message': 'Stop server before restoring a backup.'})
             return
-        socketio.emit('notification', {'status': 'info', 'message': 'Starting restore... Do not close the panel.'})
         backup_path, error = get_safe_path(server_id, os.path.join('backups', filename))
         if error:
             socketio.emit('notification', {'status': 'error', 'message': error}); return
         server_dir = server_config['cwd']
-        with zipfile.ZipFile(backup_path, 'r') as zip_ref:
-            zip_ref.extractall(server_dir)
-        socketio.emit('notification', {'status': 'success', 'message': 'Restore complete!'})
+        socketio.emit('notification', {'status': 'info', 'message': 'Starting restore... Do not close the panel.'})
+        with backup_io_slots:
+            started = time.perf_counter()
+            if filename.endswith('.json'):
+                backups_dir, store = backup_store(server_dir)
+                result = restore_manifest(server_dir, load_manifest(backups_dir, filename), store, server_id, paths, prune)
+            else:
+                result = restore_zip(server_dir, backup_path, server_id, paths, prune)
+            panel_metrics.observe('pulse_restore_seconds', (), time.perf_counter() - started)
+        message = f"Restore complete! {result['written']} files restored, {result['unchanged']} already up to date"
+        if prune: message += f", {result['pruned']} extra files removed"
+        socketio.emit('notification', {'status': 'success', 'message': message + '.'})
     except Exception as e:
         socketio.emit('notification', {'status': 'error', 'message': f'Restore failed: {e}'})
     finally:
-        backup_process_lock.release()
+        lock.release()
 
 @socketio.on('restore_backup')
 def handle_restore_backup(data):
     server_id, filename = data.get('id'), data.get('filename')
-    threading.Thread(target=_restore_backup_task, args=(server_id, filename)).start()
+    backup_executor.submit(_restore_backup_task, server_id, filename, data.get('paths'), bool(data.get('prune')))
 
 # NEW: Handlers for managing games.json
 @socketio.on('get_installable_games')
 def handle_get_installable_games(data):
-    games = load_json_file(GAMES_FILE)
+    games = games_store.get()
     socketio.emit('installable_games_list', {'games': games})
 
 @socketio.on('add_installable_game')
@@ -567,22 +3438,18 @@ def handle_add_installable_game(data):
     if not new_game or not all(k in new_game for k in ['id', 'name', 'appid']):
         socketio.emit('notification', {'status': 'error', 'message': 'Invalid game data provided.'})
         return
-    games = load_json_file(GAMES_FILE)
-    if any(g['id'] == new_game['id'] for g in games):
+    if games_store.by_id(new_game['id']):
         socketio.emit('notification', {'status': 'error', 'message': f"Game with ID '{new_game['id']}' already exists."})
         return
-    games.append(new_game)
-    save_json_file(GAMES_FILE, games)
+    games_store.update(lambda games: games.append(new_game))
     socketio.emit('notification', {'status': 'success', 'message': f"Added new game: {new_game['name']}"})
     handle_get_installable_games(None) # Refresh list for all clients
 
 @socketio.on('delete_installable_game')
 def handle_delete_installable_game(data):
     game_id = data.get('game_id')
-    games = load_json_file(GAMES_FILE)
-    new_games = [g for g in games if g['id'] != game_id]
-    if len(new_games) < len(games):
-        save_json_file(GAMES_FILE, new_games)
+    if games_store.by_id(game_id):
+        games_store.remove_by_id(game_id)
         socketio.emit('notification', {'status': 'info', 'message': 'Game removed from installer list.'})
         handle_get_installable_games(None)
     else:
@@ -595,7 +3462,14 @@ if __name__ == '__main__':
     print("Starting Pulse Panel...")
     first_time_setup()
     load_schedules()
+    steam_jobs.start()
+    console_logs.start()
+    threading.Thread(target=search_index.run, daemon=True).start()
+    threading.Thread(target=file_tailer.run, daemon=True).start()
+    threading.Thread(target=pipe_mux.run, daemon=True).start()
+    threading.Thread(target=lifecycle.run, daemon=True).start()
     threading.Thread(target=monitor_servers, daemon=True).start()
+    threading.Thread(target=console_pipeline.run, daemon=True).start()
     threading.Thread(target=scheduler_thread, daemon=True).start()
     print("Pulse Panel is running. Access it at http://127.0.0.1:5000")
     run_server()